@@ -1,7 +1,11 @@
 """PostgreSQL backup using pg_dump."""
 
 import os
-import subprocess
+import time
+import shutil
+import asyncio
+import functools
+from collections import deque
 from datetime import datetime
 from pathlib import Path
 try:
@@ -9,14 +13,101 @@ try:
 except ImportError:  # pragma: no cover
     from ..utils.subprocess_utils import validate_path
 
+# PATH does not change during the process lifetime, so read it once
+_BASE_ENV_PATH = os.environ.get('PATH', '')
+
+# Maximum time allowed for each of the pg_dump and gzip steps (2 hours)
+PG_DUMP_TIMEOUT = 7200
+
+# Minimum seconds between logged pg_dump progress lines when PG_PROGRESS is enabled
+PROGRESS_LOG_INTERVAL = 5
+
+# Number of trailing pg_dump stderr lines kept for error reporting when streaming progress
+PROGRESS_TAIL_LINES = 50
+
+
+@functools.lru_cache(maxsize=4)
+def _resolve_pg_dump(alf_base_dir):
+    """
+    Resolve the pg_dump binary for an Alfresco installation.
+    
+    Uses the embedded PostgreSQL tools to avoid a version mismatch; Alfresco ships
+    its own PostgreSQL 9.4 binaries that match the server version.
+    """
+    embedded_pg_dump = alf_base_dir / 'postgresql' / 'bin' / 'pg_dump'
+    return str(embedded_pg_dump) if embedded_pg_dump.exists() else 'pg_dump'
+
+
+def _compress_command():
+    """
+    Build the compression command for the SQL dump.
+    
+    pigz produces gzip-compatible output using all cores; gzip is the single-threaded fallback.
+    """
+    if shutil.which('pigz'):
+        return ['pigz', '-c', '-p', str(os.cpu_count() or 1)]
+    return ['gzip', '-c']
+
+
+async def _communicate(process, timeout):
+    """Wait for a subprocess to finish, killing it if it exceeds timeout."""
+    try:
+        return await asyncio.wait_for(process.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise
+
+
+async def _wait_with_progress(process, logger, tail, timeout):
+    """
+    Wait for pg_dump --verbose to finish, logging its stderr as progress.
+    
+    Lines are logged at most once every PROGRESS_LOG_INTERVAL seconds; the last
+    PROGRESS_TAIL_LINES lines are kept in tail for error reporting.
+    """
+    async def _log_lines():
+        last_logged = 0.0
+        while True:
+            line = await process.stderr.readline()
+            if not line:
+                break
+            tail.append(line)
+            now = time.monotonic()
+            if now - last_logged >= PROGRESS_LOG_INTERVAL:
+                logger.info(f"  {line.decode('utf-8', errors='replace').rstrip()}")
+                last_logged = now
+    
+    try:
+        await asyncio.wait_for(asyncio.gather(_log_lines(), process.wait()), timeout=timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise
+
 
 def backup_postgres(config):
     """
     Execute PostgreSQL backup using pg_dump to create a SQL dump file.
     
+    Synchronous wrapper around backup_postgres_async for existing callers.
+    
+    Returns dict with keys: success, path, error, duration, start_time, size_uncompressed_mb, size_compressed_mb
+    """
+    return asyncio.run(backup_postgres_async(config))
+
+
+async def backup_postgres_async(config):
+    """
+    Execute PostgreSQL backup using pg_dump to create a SQL dump file.
+    
+    Runs pg_dump and gzip as asyncio subprocesses so callers with an event loop
+    can overlap the backup with other work (retention, uploads) without a thread.
+    
     Returns dict with keys: success, path, error, duration, start_time, size_uncompressed_mb, size_compressed_mb
     """
-    start_time = datetime.now()
+    start_ts = time.time()
+    start_time = datetime.fromtimestamp(start_ts)
     timestamp_str = start_time.strftime('%Y-%m-%d_%H-%M-%S')
     
     # For S3 backups, use temp directory; for local backups, use backup_dir
@@ -51,21 +142,13 @@ def backup_postgres(config):
     import logging
     logger = logging.getLogger(__name__)
     
-    # Use embedded PostgreSQL tools to avoid version mismatch
-    # Alfresco has its own PostgreSQL 9.4 binaries that match the server version
-    embedded_pg_dump = config.alf_base_dir / 'postgresql' / 'bin' / 'pg_dump'
-    
-    if embedded_pg_dump.exists():
-        pg_dump_cmd = str(embedded_pg_dump)
-        logger.info(f"Using embedded pg_dump: {pg_dump_cmd}")
-    else:
-        pg_dump_cmd = 'pg_dump'
-        logger.info(f"Embedded pg_dump not found, using system version: {pg_dump_cmd}")
+    pg_dump_cmd = _resolve_pg_dump(config.alf_base_dir)
+    logger.debug(f"Using pg_dump: {pg_dump_cmd}")
     
     # Set PGPASSWORD for pg_dump
     env = {
         'PGPASSWORD': config.pgpassword,
-        'PATH': os.environ.get('PATH', '')
+        'PATH': _BASE_ENV_PATH
     }
     
     # Use pg_dump with gzip compression
@@ -87,24 +170,35 @@ def backup_postgres(config):
         '--no-acl',  # Skip access privileges (does NOT include user/role statements)
     ]
     
+    # pg_dump only reports per-object progress in verbose mode; keep it opt-in so
+    # stderr stays small when nothing consumes it
+    pg_progress = getattr(config, 'pg_progress', False)
+    if pg_progress:
+        pg_dump_cmd_list.append('--verbose')
+    
     # Run pg_dump first to temporary file to get uncompressed size
     try:
         # Step 1: Create uncompressed dump to measure size
         logger.info("Step 1: Creating uncompressed SQL dump...")
         with open(temp_uncompressed, 'wb') as out_file:
-            pg_dump_process = subprocess.Popen(
-                pg_dump_cmd_list,
+            pg_dump_process = await asyncio.create_subprocess_exec(
+                *pg_dump_cmd_list,
                 env=env,
                 stdout=out_file,
-                stderr=subprocess.PIPE
+                stderr=asyncio.subprocess.PIPE
             )
             
-            pg_dump_stderr = pg_dump_process.communicate()[1]
+            if pg_progress:
+                stderr_tail = deque(maxlen=PROGRESS_TAIL_LINES)
+                await _wait_with_progress(pg_dump_process, logger, stderr_tail, PG_DUMP_TIMEOUT)
+                pg_dump_stderr = b''.join(stderr_tail)
+            else:
+                pg_dump_stderr = (await _communicate(pg_dump_process, PG_DUMP_TIMEOUT))[1]
             
             if pg_dump_process.returncode != 0:
                 error_msg = pg_dump_stderr.decode('utf-8', errors='replace') if pg_dump_stderr else 'Unknown error'
                 result['error'] = f"pg_dump failed with exit code {pg_dump_process.returncode}: {error_msg}"
-                result['duration'] = (datetime.now() - start_time).total_seconds()
+                result['duration'] = time.time() - start_ts
                 if temp_uncompressed.exists():
                     partial_size = temp_uncompressed.stat().st_size
                     if partial_size > 0:
@@ -123,26 +217,27 @@ def backup_postgres(config):
                 logger.info(f"Uncompressed dump size: {uncompressed_size / (1024**2):.2f} MB")
         else:
             result['error'] = "pg_dump completed but no output file was created"
-            result['duration'] = (datetime.now() - start_time).total_seconds()
+            result['duration'] = time.time() - start_ts
             return result
         
         # Step 2: Compress the dump file
-        logger.info("Step 2: Compressing SQL dump with gzip...")
+        compress_cmd = _compress_command()
+        logger.info(f"Step 2: Compressing SQL dump with {compress_cmd[0]}...")
         with open(temp_uncompressed, 'rb') as in_file:
             with open(backup_file, 'wb') as out_file:
-                gzip_process = subprocess.Popen(
-                    ['gzip', '-c'],
+                gzip_process = await asyncio.create_subprocess_exec(
+                    *compress_cmd,
                     stdin=in_file,
                     stdout=out_file,
-                    stderr=subprocess.PIPE
+                    stderr=asyncio.subprocess.PIPE
                 )
                 
-                gzip_stderr = gzip_process.communicate()[1]
+                gzip_stderr = (await _communicate(gzip_process, PG_DUMP_TIMEOUT))[1]
                 
                 if gzip_process.returncode != 0:
                     error_msg = gzip_stderr.decode('utf-8', errors='replace') if gzip_stderr else 'Unknown error'
-                    result['error'] = f"gzip failed with exit code {gzip_process.returncode}: {error_msg}"
-                    result['duration'] = (datetime.now() - start_time).total_seconds()
+                    result['error'] = f"{compress_cmd[0]} failed with exit code {gzip_process.returncode}: {error_msg}"
+                    result['duration'] = time.time() - start_ts
                     if backup_file.exists():
                         backup_file.unlink()
                     if temp_uncompressed.exists():
@@ -161,8 +256,8 @@ def backup_postgres(config):
                 compression_ratio = (1 - compressed_size / uncompressed_size) * 100
                 logger.info(f"Compression ratio: {compression_ratio:.1f}%")
         else:
-            result['error'] = "gzip completed but no compressed file was created"
-            result['duration'] = (datetime.now() - start_time).total_seconds()
+            result['error'] = f"{compress_cmd[0]} completed but no compressed file was created"
+            result['duration'] = time.time() - start_ts
             if temp_uncompressed.exists():
                 temp_uncompressed.unlink()
             return result
@@ -213,17 +308,17 @@ def backup_postgres(config):
                     result['s3_error'] = str(e)
             
             result['success'] = True
-            result['duration'] = (datetime.now() - start_time).total_seconds()
+            result['duration'] = time.time() - start_ts
         else:
             result['error'] = "Backup file created but is suspiciously small or empty"
             if backup_file.exists():
                 backup_file.unlink()
     
-    except subprocess.TimeoutExpired:
-        elapsed = (datetime.now() - start_time).total_seconds()
+    except asyncio.TimeoutError:
+        elapsed = time.time() - start_ts
         result['duration'] = elapsed
         result['error'] = f"Backup timed out after {elapsed/3600:.2f} hours"
-        result['timeout_seconds'] = 7200  # 2 hours default
+        result['timeout_seconds'] = PG_DUMP_TIMEOUT
         result['elapsed_before_timeout'] = elapsed
         # Check for partial dump
         if temp_uncompressed.exists():
@@ -235,10 +330,10 @@ def backup_postgres(config):
             backup_file.unlink()
     except FileNotFoundError:
         result['error'] = f"Command not found: {pg_dump_cmd}"
-        result['duration'] = (datetime.now() - start_time).total_seconds()
+        result['duration'] = time.time() - start_ts
     except Exception as e:
         result['error'] = f"Unexpected error during backup: {str(e)}"
-        result['duration'] = (datetime.now() - start_time).total_seconds()
+        result['duration'] = time.time() - start_ts
         import traceback
         logger.error(f"Unexpected error: {traceback.format_exc()}")
         if backup_file.exists():
@@ -1,10 +1,121 @@
 """Retention policy enforcement - cleanup old backups."""
 
+import os
+import json
 import time
+import contextlib
+import uuid
 import shutil
+import threading
+import subprocess
 from pathlib import Path
 from datetime import datetime
 
+# Sidecar file recording the oldest backup timestamp seen by the last full scan
+RETENTION_MARKER = '.retention_oldest'
+
+# Prefix for expired snapshots renamed aside while awaiting background deletion
+TRASH_PREFIX = '.trash-'
+
+
+def _move_to_trash(item):
+    """Atomically rename an expired backup to a hidden sibling and return the new path."""
+    trash = item.parent / f'{TRASH_PREFIX}{uuid.uuid4().hex}'
+    os.rename(item, trash)
+    return trash
+
+
+def _fast_rmtree(path):
+    """
+    Recursively delete a directory tree.
+    
+    GNU find walks and unlinks the tree in a single process with no per-entry
+    interpreter overhead; shutil.rmtree is kept as a fallback on Windows or
+    when find is unavailable.
+    """
+    if os.name == 'nt' or not shutil.which('find'):
+        shutil.rmtree(path)
+        return
+    
+    process = subprocess.run(
+        ['find', str(path), '-depth', '-delete'],
+        capture_output=True,
+        text=True,
+        timeout=3600
+    )
+    if process.returncode != 0:
+        raise OSError(f"find -delete exited with {process.returncode}: {process.stderr.strip()}")
+
+
+def _collect_trash(directory):
+    """Return the renamed snapshots an interrupted earlier run left behind in directory."""
+    with os.scandir(directory) as entries:
+        return [(Path(entry.path), Path(entry.path), 'Contentstore (leftover trash)') for entry in entries
+                if entry.name.startswith(TRASH_PREFIX) and entry.is_dir()]
+
+
+def _delete_in_background(pending, deleted, errors):
+    """
+    Recursively delete renamed snapshots in a background thread.
+    
+    pending holds (trash_path, original_path, kind) tuples, where kind labels the
+    deleted_items entry. Each snapshot is reported in deleted or errors only once
+    its deletion has finished; the caller must join the returned thread before
+    reading either list.
+    """
+    def _worker():
+        for trash, item, kind in pending:
+            try:
+                _fast_rmtree(trash)
+                deleted.append(f"{kind}: {item}")
+            except Exception as e:
+                errors.append(f"Failed to delete {item}: {str(e)}")
+    
+    thread = threading.Thread(target=_worker, name='retention-delete', daemon=False)
+    thread.start()
+    return thread
+
+
+def _read_retention_marker(directory):
+    """Return the oldest backup timestamp recorded by the last full scan, or None."""
+    try:
+        with open(directory / RETENTION_MARKER, 'r') as f:
+            return json.load(f).get('oldest')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _write_retention_marker(directory, oldest):
+    """Record the oldest remaining backup timestamp after a full scan."""
+    try:
+        with open(directory / RETENTION_MARKER, 'w') as f:
+            json.dump({'oldest': oldest}, f)
+    except OSError:
+        # The marker is only an optimization - a missing marker forces a full scan next time
+        pass
+
+
+def _can_skip_sweep(directory, cutoff):
+    """
+    Check whether a retention sweep of directory can be skipped entirely.
+    
+    The marker written by the last full scan is the only evidence: if nothing it
+    saw was older than the cutoff, no entry can be stale yet, because backups
+    created since then are newer still. An older backup copied in by hand is not
+    noticed until the marker expires or is deleted.
+    """
+    oldest = _read_retention_marker(directory)
+    return oldest is not None and oldest >= cutoff
+
+
+@contextlib.contextmanager
+def _collect_errors(errors, label):
+    """Record any exception raised in the block as a retention error instead of propagating it."""
+    try:
+        yield
+    except Exception as e:
+        errors.append(f"Error cleaning {label}: {str(e)}")
+
 
 def apply_retention(config):
     """
@@ -30,14 +141,26 @@ def apply_retention(config):
     
     errors = []
     deleted = []
+    # Expired contentstore snapshots already renamed aside, awaiting recursive deletion
+    pending = []
+    deleter = None
+    now = time.time()
+    cutoff = now - (config.retention_days * 86400)
     
     # Clean up old contentstore backups
-    try:
+    with _collect_errors(errors, 'contentstore backups'):
         contentstore_dir = config.backup_dir / 'contentstore'
         if contentstore_dir.exists():
-            for item in contentstore_dir.iterdir():
-                if (item.is_dir() and 
-                    item.name.startswith('contentstore-')):
+            # Swept on every run, even when the age scan below is skipped
+            pending.extend(_collect_trash(contentstore_dir))
+        if contentstore_dir.exists() and not _can_skip_sweep(contentstore_dir, cutoff):
+            oldest_kept = None
+            # scandir streams entries and answers is_dir() from d_type without a stat per entry
+            with os.scandir(contentstore_dir) as entries:
+                for entry in entries:
+                    if not (entry.name.startswith('contentstore-') and entry.is_dir()):
+                        continue
+                    item = Path(entry.path)
                     # Parse timestamp from directory name (contentstore-YYYY-MM-DD_HH-MM-SS)
                     try:
                         # Extract timestamp from directory name
@@ -47,31 +170,43 @@ def apply_retention(config):
                         backup_timestamp = backup_time.timestamp()
                         
                         # Check if backup is older than retention period
-                        if backup_timestamp < time.time() - (config.retention_days * 86400):
-                            shutil.rmtree(item)
-                            deleted.append(f"Contentstore: {item}")
+                        if backup_timestamp < cutoff:
+                            pending.append((_move_to_trash(item), item, 'Contentstore'))
+                            continue
                     except ValueError:
                         # If we can't parse the timestamp, fall back to file modification time
-                        if item.stat().st_mtime < time.time() - (config.retention_days * 86400):
+                        backup_timestamp = entry.stat().st_mtime
+                        if backup_timestamp < cutoff:
                             try:
-                                shutil.rmtree(item)
-                                deleted.append(f"Contentstore: {item}")
+                                pending.append((_move_to_trash(item), item, 'Contentstore'))
+                                continue
                             except Exception as e:
                                 errors.append(f"Failed to delete {item}: {str(e)}")
                     except Exception as e:
                         errors.append(f"Failed to delete {item}: {str(e)}")
+                    
+                    if oldest_kept is None or backup_timestamp < oldest_kept:
+                        oldest_kept = backup_timestamp
+            
+            _write_retention_marker(contentstore_dir, oldest_kept if oldest_kept is not None else now)
     
-    except Exception as e:
-        errors.append(f"Error cleaning contentstore backups: {str(e)}")
+    # Renames are cheap metadata operations; the slow recursive unlink of
+    # millions of hardlinks overlaps with the PostgreSQL cleanup below
+    if pending:
+        deleter = _delete_in_background(pending, deleted, errors)
     
     # Clean up old PostgreSQL backups
-    try:
+    with _collect_errors(errors, 'PostgreSQL backups'):
         postgres_dir = config.backup_dir / 'postgres'
-        if postgres_dir.exists():
-            for item in postgres_dir.iterdir():
-                if (item.is_file() and 
-                    item.name.startswith('postgres-') and 
-                    item.name.endswith('.sql.gz')):
+        if postgres_dir.exists() and not _can_skip_sweep(postgres_dir, cutoff):
+            oldest_kept = None
+            with os.scandir(postgres_dir) as entries:
+                for entry in entries:
+                    if not (entry.name.startswith('postgres-') and
+                            entry.name.endswith('.sql.gz') and
+                            entry.is_file()):
+                        continue
+                    item = Path(entry.path)
                     # Parse timestamp from filename (postgres-YYYY-MM-DD_HH-MM-SS.sql.gz)
                     try:
                         # Extract timestamp from filename
@@ -81,22 +216,32 @@ def apply_retention(config):
                         backup_timestamp = backup_time.timestamp()
                         
                         # Check if backup is older than retention period
-                        if backup_timestamp < time.time() - (config.retention_days * 86400):
+                        if backup_timestamp < cutoff:
                             item.unlink()
                             deleted.append(f"PostgreSQL: {item}")
+                            continue
                     except ValueError:
                         # If we can't parse the timestamp, fall back to file modification time
-                        if item.stat().st_mtime < time.time() - (config.retention_days * 86400):
+                        backup_timestamp = entry.stat().st_mtime
+                        if backup_timestamp < cutoff:
                             try:
                                 item.unlink()
                                 deleted.append(f"PostgreSQL: {item}")
+                                continue
                             except Exception as e:
                                 errors.append(f"Failed to delete {item}: {str(e)}")
                     except Exception as e:
                         errors.append(f"Failed to delete {item}: {str(e)}")
+                    
+                    if oldest_kept is None or backup_timestamp < oldest_kept:
+                        oldest_kept = backup_timestamp
+            
+            _write_retention_marker(postgres_dir, oldest_kept if oldest_kept is not None else now)
     
-    except Exception as e:
-        errors.append(f"Error cleaning PostgreSQL backups: {str(e)}")
+    # Wait for the contentstore deletions so their outcome is reported, and so
+    # they finish while the caller still holds the backup lock
+    if deleter is not None:
+        deleter.join()
     
     # Build result
     result['deleted_items'] = deleted
@@ -108,4 +253,3 @@ def apply_retention(config):
         result['success'] = True
     
     return result
-
@@ -6,7 +6,11 @@ Automated restore procedures for Alfresco backups with PostgreSQL and contentsto
 """
 
 import os
+import re
 import sys
+import errno
+import select
+import signal
 import logging
 import shutil
 import subprocess
@@ -41,6 +45,11 @@ except ImportError:  # pragma: no cover
         return _DummyTqdm(iterable=iterable, total=total)
 
 
+# pgrep -f style patterns for the Tomcat and Alfresco Java processes
+TOMCAT_PROCESS_PATTERN = 'java.*tomcat|java.*alfresco.*tomcat'
+ALFRESCO_PROCESS_PATTERN = 'java.*alfresco'
+
+
 class RestoreConfig:
     """Configuration for restore operations."""
     
@@ -142,7 +151,9 @@ class AlfrescoRestore:
     def __init__(self, config: RestoreConfig, logger: RestoreLogger):
         self.config = config
         self.logger = logger
-        
+        # PostgreSQL binaries resolved by _pg_tool(), keyed by name
+        self._pg_tools = {}
+
     def start_alfresco_full(self) -> bool:
         """Start all Alfresco services (including PostgreSQL)."""
         self.logger.info("Starting all Alfresco services...")
@@ -153,12 +164,7 @@ class AlfrescoRestore:
             self.logger.info("Initializing PostgreSQL data directory...")
             
             # Find initdb binary
-            alf_base_path = Path(self.config.alf_base_dir) if isinstance(self.config.alf_base_dir, str) else self.config.alf_base_dir
-            embedded_initdb = alf_base_path / 'postgresql' / 'bin' / 'initdb'
-            if embedded_initdb.exists():
-                initdb_cmd = str(embedded_initdb)
-            else:
-                initdb_cmd = 'initdb'
+            initdb_cmd = self._pg_tool('initdb')
             
             try:
                 # Create parent directory if needed
@@ -308,12 +314,7 @@ class AlfrescoRestore:
         self.logger.info("Checking if Tomcat process is running...")
         
         try:
-            result = subprocess.run(
-                ['pgrep', '-f', 'java.*tomcat|java.*alfresco.*tomcat'],
-                capture_output=True,
-                text=True
-            )
-            if result.returncode == 0:
+            if self._find_processes(TOMCAT_PROCESS_PATTERN):
                 self.logger.info("Tomcat process is running - assuming startup successful")
                 return True
         except Exception:
@@ -352,35 +353,62 @@ class AlfrescoRestore:
             self.logger.error(f"Error stopping Tomcat: {e}")
             return False
     
-    def _stop_tomcat_process(self) -> bool:
-        """Stop Tomcat by finding and killing the Java process."""
+    def _stop_tomcat_process(self, grace_seconds: int = 30) -> bool:
+        """
+        Stop Tomcat by finding and killing the Java process.
+        Only processes whose command line refers to a path under ALF_BASE_DIR are
+        signalled, so other Tomcat instances on the host are left alone. Processes
+        still running grace_seconds after SIGTERM are sent SIGKILL. Returns False
+        unless Tomcat is known to be stopped, including when Tomcat processes are
+        running that cannot be tied to ALF_BASE_DIR.
+        """
         try:
             # Find tomcat process (java process with tomcat/alfresco in classpath)
-            result = subprocess.run(
-                ['pgrep', '-f', 'java.*tomcat|java.*alfresco.*tomcat'],
-                capture_output=True,
-                text=True
-            )
+            base_dir = os.path.realpath(str(self.config.alf_base_dir))
+            pids = self._find_processes(TOMCAT_PROCESS_PATTERN, under=base_dir)
             
-            if result.returncode == 0:
-                pids = result.stdout.strip().split('\n')
-                for pid in pids:
-                    if pid:
+            if pids:
+                # Opened before signalling, so a recycled PID is never mistaken for Tomcat
+                pidfds = self._open_pidfds(pids)
+                try:
+                    for pid in pids:
+                        if pidfds is not None and pid not in pidfds:
+                            continue  # Exited before it could be signalled
                         self.logger.info(f"Stopping Tomcat process {pid}")
-                        subprocess.run(['sudo', '-u', self.config.alfresco_user, 'kill', pid], check=False)
-                
-                # Wait a bit for processes to stop
-                import time
-                time.sleep(5)
+                        self._signal_process(pid, pidfds[pid] if pidfds is not None else None, signal.SIGTERM)
+                    
+                    if pidfds is not None:
+                        # Returns as soon as the last process exits
+                        stopped = self._wait_for_pidfds(list(pidfds.values()), grace_seconds)
+                        if not stopped:
+                            self.logger.warning(f"Tomcat did not stop within {grace_seconds}s, sending SIGKILL")
+                            for pid, fd in pidfds.items():
+                                self._signal_process(pid, fd, signal.SIGKILL)
+                            stopped = self._wait_for_pidfds(list(pidfds.values()), 10)
+                    else:
+                        # Without pidfds, re-scan the process list once a second instead
+                        remaining = self._poll_processes(pids, base_dir, grace_seconds)
+                        if remaining:
+                            self.logger.warning(f"Tomcat did not stop within {grace_seconds}s, sending SIGKILL")
+                            for pid in remaining:
+                                self._signal_process(pid, None, signal.SIGKILL)
+                            remaining = self._poll_processes(remaining, base_dir, 10)
+                        stopped = not remaining
+                finally:
+                    for fd in (pidfds or {}).values():
+                        os.close(fd)
                 
-                # Verify tomcat is stopped
-                result = subprocess.run(['pgrep', '-f', 'java.*tomcat|java.*alfresco.*tomcat'], capture_output=True)
-                if result.returncode != 0:
+                if stopped:
                     self.logger.info("Tomcat stopped successfully")
                     return True
                 else:
-                    self.logger.warning("Some Tomcat processes may still be running")
-                    return True
+                    self.logger.error("Some Tomcat processes may still be running")
+                    return False
+            elif self._find_processes(TOMCAT_PROCESS_PATTERN):
+                # Restoring under a running Tomcat would corrupt the repository
+                self.logger.error(f"Tomcat processes are running but none refer to {base_dir}; "
+                                  f"stop Tomcat manually before restoring")
+                return False
             else:
                 self.logger.info("No Tomcat processes found (may already be stopped)")
                 return True
@@ -389,6 +417,147 @@ class AlfrescoRestore:
             self.logger.error(f"Error stopping Tomcat process: {e}")
             return False
     
+    def _pg_tool(self, name: str) -> str:
+        """
+        Return the embedded PostgreSQL binary name under ALF_BASE_DIR if it exists,
+        else the bare name for a PATH lookup. Each tool is checked only once.
+        """
+        if name not in self._pg_tools:
+            embedded = Path(self.config.alf_base_dir) / 'postgresql' / 'bin' / name
+            self._pg_tools[name] = str(embedded) if embedded.exists() else name
+        return self._pg_tools[name]
+    
+    def _find_processes(self, pattern: str, under: Optional[str] = None) -> List[str]:
+        """
+        Return the PIDs whose full command line matches pattern, like pgrep -f,
+        and also refers to a path inside the resolved directory under when one
+        is passed (see _cmdline_refers_to).
+        Reads /proc/<pid>/cmdline in-process rather than forking pgrep, which
+        is only used when /proc is not available.
+        """
+        try:
+            entries = os.listdir('/proc')
+        except OSError:
+            # -a prints each PID followed by its full command line
+            result = subprocess.run(['pgrep', '-af', pattern], capture_output=True, text=True)
+            if result.returncode != 0:
+                return []
+            return [line.split(None, 1)[0] for line in result.stdout.splitlines()
+                    if under is None or self._cmdline_refers_to(line, under)]
+        
+        regex = re.compile(pattern)
+        own_pid = str(os.getpid())
+        pids = []
+        for entry in entries:
+            if not entry.isdigit() or entry == own_pid:
+                continue
+            try:
+                with open(f'/proc/{entry}/cmdline', 'rb') as f:
+                    cmdline = f.read()
+            except OSError:
+                continue  # Exited while scanning
+            # Arguments are NUL-separated; pgrep -f matches them joined by spaces
+            text = cmdline.rstrip(b'\0').replace(b'\0', b' ').decode('utf-8', 'replace')
+            if text and regex.search(text) and (under is None or self._cmdline_refers_to(text, under)):
+                pids.append(entry)
+        return pids
+    
+    @staticmethod
+    def _cmdline_refers_to(cmdline: str, directory: str) -> bool:
+        """
+        Check whether any absolute path in cmdline, such as -Dcatalina.home=... or
+        a classpath entry, resolves to directory or a path inside it. Paths are
+        compared after os.path.realpath, so symlinks and trailing slashes on either
+        side do not matter.
+        """
+        for token in re.split(r'[\s=:]+', cmdline):
+            if not token.startswith('/'):
+                continue
+            resolved = os.path.realpath(token)
+            if resolved == directory or resolved.startswith(directory.rstrip('/') + '/'):
+                return True
+        return False
+    
+    def _poll_processes(self, pids: List[str], under: str, timeout: float) -> List[str]:
+        """
+        Re-scan the Tomcat processes once a second until none of pids is left or
+        timeout seconds pass, and return the ones still running. Used when pidfds
+        are unavailable, so a PID reused by another matching process in the
+        meantime is still counted as running.
+        """
+        import time
+        
+        deadline = time.monotonic() + timeout
+        while True:
+            running = [pid for pid in self._find_processes(TOMCAT_PROCESS_PATTERN, under=under)
+                       if pid in pids]
+            if not running or time.monotonic() >= deadline:
+                return running
+            time.sleep(1)
+    
+    def _open_pidfds(self, pids: List[str]) -> Optional[Dict[str, int]]:
+        """
+        Open a pidfd for each PID that is still running, keyed by PID.
+        Returns None when pidfds are unsupported (Python < 3.9 or Linux < 5.3)
+        so the caller can fall back to sleeping and re-checking the process list.
+        """
+        if not hasattr(os, 'pidfd_open'):
+            return None
+        
+        pidfds = {}
+        for pid in pids:
+            try:
+                pidfds[pid] = os.pidfd_open(int(pid))
+            except ProcessLookupError:
+                continue  # Already exited
+            except OSError as e:
+                for fd in pidfds.values():
+                    os.close(fd)
+                if e.errno in (errno.ENOSYS, errno.EPERM):
+                    return None
+                raise
+        return pidfds
+    
+    def _signal_process(self, pid: str, pidfd: Optional[int], sig: signal.Signals):
+        """
+        Send sig to pid, through its pidfd when there is one so the signal
+        cannot reach a process that reused the PID. Falls back to kill as the
+        Alfresco user when this process may not signal it directly.
+        """
+        if pidfd is not None:
+            try:
+                signal.pidfd_send_signal(pidfd, sig)
+                return
+            except ProcessLookupError:
+                return  # Already exited
+            except PermissionError:
+                pass
+        
+        subprocess.run(['sudo', '-u', self.config.alfresco_user, 'kill', f'-{sig.name[3:]}', pid], check=False)
+    
+    def _wait_for_pidfds(self, pidfds: List[int], timeout: float) -> bool:
+        """
+        Block until every process behind pidfds has exited or timeout seconds pass.
+        A pidfd becomes readable when its process exits, so this wakes up
+        immediately instead of sleeping a fixed interval. Returns True if all exited.
+        """
+        import time
+        
+        poller = select.poll()
+        for fd in pidfds:
+            poller.register(fd, select.POLLIN)
+        
+        remaining = len(pidfds)
+        deadline = time.monotonic() + timeout
+        while remaining:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return False
+            for fd, _event in poller.poll(left * 1000):
+                poller.unregister(fd)
+                remaining -= 1
+        return True
+    
     def verify_postgresql_running(self) -> bool:
         """Verify that PostgreSQL is running and accepting connections."""
         self.logger.info("Verifying PostgreSQL is running...")
@@ -424,12 +593,7 @@ class AlfrescoRestore:
             pg_database = os.getenv('PGDATABASE', 'postgres')
             
             # Use embedded psql if available
-            alf_base_path = Path(self.config.alf_base_dir) if isinstance(self.config.alf_base_dir, str) else self.config.alf_base_dir
-            embedded_psql = alf_base_path / 'postgresql' / 'bin' / 'psql'
-            if embedded_psql.exists():
-                psql_cmd = str(embedded_psql)
-            else:
-                psql_cmd = 'psql'
+            psql_cmd = self._pg_tool('psql')
             
             env = os.environ.copy()
             if pg_password:
@@ -493,9 +657,7 @@ class AlfrescoRestore:
     def verify_stopped(self) -> bool:
         """Verify that Alfresco and PostgreSQL are stopped."""
         try:
-            result = subprocess.run(['pgrep', '-f', 'java.*alfresco'],
-                                  capture_output=True)
-            if result.returncode == 0:
+            if self._find_processes(ALFRESCO_PROCESS_PATTERN):
                 self.logger.error("Alfresco Java processes are still running!")
                 return False
             
@@ -841,14 +1003,10 @@ class AlfrescoRestore:
             return False
         
         # Use embedded PostgreSQL tools if available
-        # Ensure alf_base_dir is a Path object
-        alf_base_path = Path(self.config.alf_base_dir) if isinstance(self.config.alf_base_dir, str) else self.config.alf_base_dir
-        embedded_psql = alf_base_path / 'postgresql' / 'bin' / 'psql'
-        if embedded_psql.exists():
-            psql_cmd = str(embedded_psql)
+        psql_cmd = self._pg_tool('psql')
+        if psql_cmd != 'psql':
             self.logger.info(f"Using embedded psql: {psql_cmd}")
         else:
-            psql_cmd = 'psql'
             self.logger.info(f"Using system psql: {psql_cmd}")
         
         try:
@@ -1372,10 +1530,14 @@ recovery_target_timeline = 'latest'
         workspace_index = solr4_dir / 'workspace' / 'SpacesStore' / 'index'
         archive_index = solr4_dir / 'archive' / 'SpacesStore' / 'index'
         
-        if workspace_index.exists() or archive_index.exists():
+        # Stat each index once; the results decide both the message and what to clear
+        workspace_exists = workspace_index.exists()
+        archive_exists = archive_index.exists()
+        
+        if workspace_exists or archive_exists:
             self.logger.info("Found embedded Solr4 indexes")
             
-            if workspace_index.exists():
+            if workspace_exists:
                 self.logger.info(f"Clearing workspace index: {workspace_index}")
                 try:
                     subprocess.run(
@@ -1388,7 +1550,7 @@ recovery_target_timeline = 'latest'
                     self.logger.error(f"Failed to clear workspace index: {e}")
                     return False
             
-            if archive_index.exists():
+            if archive_exists:
                 self.logger.info(f"Clearing archive index: {archive_index}")
                 try:
                     subprocess.run(
@@ -98,6 +98,9 @@ class BackupConfig:
             print("WARNING: Invalid CONTENTSTORE_PARALLEL_THREADS, using 4")
             self.contentstore_parallel_threads = 4
         
+        # PostgreSQL dump progress logging (optional, default off)
+        self.pg_progress = os.getenv('PG_PROGRESS', 'false').strip().lower() in ('1', 'true', 'yes')
+        
         # S3 backup configuration (optional)
         self.s3_enabled = bool(os.getenv('S3_BUCKET'))
         if self.s3_enabled:
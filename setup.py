@@ -7,12 +7,60 @@ Can be run as regular user (will prompt for sudo when needed) or with sudo.
 """
 
 import os
+import re
+import errno
 import sys
+import pwd
+import shlex
+import stat
 import subprocess
 import shutil
+import functools
+import contextlib
+import json
+from argparse import ArgumentParser
 from pathlib import Path
 from typing import Optional, Tuple
 
+# Matches jdbc:postgresql://host[:port]/database in alfresco-global.properties
+_JDBC_PG_RE = re.compile(r'jdbc:postgresql://([^:]+):?(\d+)?/(.+)')
+
+# Matches a key=value line, skipping blank and comment lines, with surrounding whitespace trimmed
+_PROP_RE = re.compile(r'^\s*([^#=\s][^=]*?)\s*=\s*(.*?)\s*$')
+
+# Candidate locations, relative to ALF_BASE_DIR, in the order they are tried
+_ALFRESCO_GLOBAL_PROPERTIES_PATHS = (
+    'tomcat/shared/classes/alfresco-global.properties',
+    'alf_data/tomcat/shared/classes/alfresco-global.properties',
+)
+# Embedded PostgreSQL data directories holding postgresql.conf and pg_hba.conf
+_POSTGRESQL_DIRS = (
+    'postgresql',
+    'alf_data/postgresql',
+)
+
+# os.stat results (None for missing paths) keyed by path string; see cached_stat()
+_STAT_CACHE = {}
+
+# Results of read-only commands run with run_command(..., cacheable=True), keyed by argv
+_CMD_CACHE = {}
+
+# Answers preloaded with --config, keyed by .env setting name; see prompt_line()
+_PRESET_ANSWERS = {}
+
+# Set by --non-interactive: prompts use preset answers or defaults instead of reading stdin
+_NON_INTERACTIVE = False
+
+# Setup steps that finished in an earlier run; see load_setup_state()
+_SETUP_STATE_FILE = Path('.setup_state.json')
+
+# Steps recorded in _SETUP_STATE_FILE; the file is removed once all of them succeed
+_SETUP_STEPS = frozenset({'env', 'directories', 'venv', 'cron'})
+
+# Accepted replies to ask_yes_no(), already lower-cased
+_YES = frozenset({'y', 'yes'})
+_NO = frozenset({'n', 'no'})
+
 class Colors:
     HEADER = '\033[95m'
     OKBLUE = '\033[94m'
@@ -40,9 +88,11 @@ def print_warning(message: str):
 def print_error(message: str):
     print(f"{Colors.FAIL}✗ {message}{Colors.ENDC}")
 
+@functools.lru_cache(maxsize=None)
 def get_real_user() -> Tuple[str, int, int]:
     """
     Get the real user (not root) even if script is run with sudo.
+    The result is cached, since the invoking user cannot change during a run.
     Returns: (username, uid, gid)
     """
     if os.geteuid() == 0:  # Running as root
@@ -50,7 +100,6 @@ def get_real_user() -> Tuple[str, int, int]:
         sudo_user = os.environ.get('SUDO_USER')
         if sudo_user:
             # Get UID and GID of the real user
-            import pwd
             try:
                 pw_record = pwd.getpwnam(sudo_user)
                 return (sudo_user, pw_record.pw_uid, pw_record.pw_gid)
@@ -60,39 +109,85 @@ def get_real_user() -> Tuple[str, int, int]:
     # Not running as root, or couldn't find SUDO_USER
     return (os.environ.get('USER', 'unknown'), os.getuid(), os.getgid())
 
+@functools.lru_cache(maxsize=None)
 def is_running_as_root() -> bool:
     """Check if script is running as root/sudo."""
     return os.geteuid() == 0
 
+def _read_line(prompt: str) -> str:
+    """
+    Show prompt in the prompt colour and return the stripped reply.
+    Writes straight to stdout and reads stdin, skipping input()'s extra
+    flushes; raises EOFError like input() when stdin is closed.
+    """
+    sys.stdout.write(f"{Colors.OKCYAN}{prompt}{Colors.ENDC}")
+    sys.stdout.flush()
+    line = sys.stdin.readline()
+    if not line:
+        raise EOFError
+    return line.strip()
+
 def ask_yes_no(question: str, default: bool = True) -> bool:
     """Ask a yes/no question and return the answer."""
+    if _NON_INTERACTIVE:
+        # Unattended runs take the default answer
+        return default
+    
     default_str = "Y/n" if default else "y/N"
     while True:
-        response = input(f"{Colors.OKCYAN}{question} [{default_str}]: {Colors.ENDC}").strip().lower()
+        response = _read_line(f"{question} [{default_str}]: ").lower()
         if not response:
             return default
-        if response in ['y', 'yes']:
+        if response in _YES:
             return True
-        if response in ['n', 'no']:
+        if response in _NO:
             return False
         print_warning("Please answer 'y' or 'n'")
 
-def run_command(cmd: list, capture_output: bool = False, check: bool = True) -> Optional[subprocess.CompletedProcess]:
-    """Run a shell command with consistent logging."""
+def _command_cache_key(cmd: list, capture_output: bool, discard_output: bool) -> tuple:
+    """Return the _CMD_CACHE key for a run_command() call."""
+    return (tuple(cmd), capture_output, discard_output)
+
+def run_command(cmd: list, capture_output: bool = False, check: bool = True,
+                log_output: bool = True, cacheable: bool = False,
+                input_text: Optional[str] = None,
+                discard_output: bool = False) -> Optional[subprocess.CompletedProcess]:
+    """
+    Run a shell command with consistent logging.
+    input_text, if given, is written to the command's stdin.
+    Pass log_output=False when the caller inspects captured stdout itself,
+    so it is not stripped and echoed as well.
+    Pass discard_output=True when only the return code and stderr matter;
+    stdout goes to /dev/null instead of being piped and decoded.
+    Pass cacheable=True for read-only commands to reuse an earlier result;
+    callers that change what such a command reports must call forget_command().
+    """
+    cache_key = _command_cache_key(cmd, capture_output, discard_output)
+    if cacheable and cache_key in _CMD_CACHE:
+        return _CMD_CACHE[cache_key]
+    
+    if discard_output:
+        streams = {'stdout': subprocess.DEVNULL, 'stderr': subprocess.PIPE}
+        capture_output = True
+    else:
+        streams = {'capture_output': capture_output}
+    
     print_info(f"Running command: {' '.join(cmd)}")
     try:
-        result = subprocess.run(cmd, capture_output=capture_output, text=True, check=False)
+        result = subprocess.run(cmd, text=True, check=False, input=input_text, **streams)
+        if cacheable:
+            _CMD_CACHE[cache_key] = result
         if result.returncode != 0:
             print_error(f"Command exited with {result.returncode}")
             if capture_output:
-                if result.stdout:
+                if log_output and result.stdout:
                     print_info(f"STDOUT:\n{result.stdout.strip()}")
                 if result.stderr:
                     print_error(f"STDERR:\n{result.stderr.strip()}")
             if check:
                 return None
         else:
-            if capture_output and result.stdout:
+            if capture_output and log_output and result.stdout:
                 print_info(f"STDOUT:\n{result.stdout.strip()}")
         return result
     except FileNotFoundError:
@@ -102,10 +197,13 @@ def run_command(cmd: list, capture_output: bool = False, check: bool = True) ->
         print_error(f"Error running command: {e}")
         return None
 
+def forget_command(cmd: list, capture_output: bool = False, discard_output: bool = False):
+    """Drop a cached run_command() result after changing what the command reports."""
+    _CMD_CACHE.pop(_command_cache_key(cmd, capture_output, discard_output), None)
+
 def check_rclone_installed() -> bool:
     """Check if rclone is installed."""
-    result = run_command(['which', 'rclone'], capture_output=True, check=False)
-    return result is not None and result.returncode == 0
+    return shutil.which('rclone') is not None
 
 
 def install_rclone() -> bool:
@@ -117,24 +215,24 @@ def install_rclone() -> bool:
         if not ask_yes_no("Install rclone with sudo?", default=True):
             return False
         
-        result = run_command(['sudo', 'apt-get', 'update'], capture_output=True, check=False)
+        result = run_command(['sudo', 'apt-get', 'update'], check=False, discard_output=True)
         if result is None or result.returncode != 0:
             print_error("Failed to update apt package list")
             return False
         
-        result = run_command(['sudo', 'apt-get', 'install', '-y', 'rclone'], capture_output=True, check=False)
+        result = run_command(['sudo', 'apt-get', 'install', '-y', 'rclone'], check=False, discard_output=True)
         if result is None or result.returncode != 0:
             print_error("Failed to install rclone")
             if result and result.stderr:
                 print_error(f"Error: {result.stderr.strip()}")
             return False
     else:
-        result = run_command(['apt-get', 'update'], capture_output=True, check=False)
+        result = run_command(['apt-get', 'update'], check=False, discard_output=True)
         if result is None or result.returncode != 0:
             print_error("Failed to update apt package list")
             return False
         
-        result = run_command(['apt-get', 'install', '-y', 'rclone'], capture_output=True, check=False)
+        result = run_command(['apt-get', 'install', '-y', 'rclone'], check=False, discard_output=True)
         if result is None or result.returncode != 0:
             print_error("Failed to install rclone")
             if result and result.stderr:
@@ -172,8 +270,8 @@ def check_prerequisites(for_restore=False):
     
     missing_tools = []
     for cmd, name in required_tools.items():
-        result = run_command(['which', cmd], capture_output=True, check=False)
-        if result and result.returncode == 0:
+        # shutil.which searches PATH in-process instead of forking /usr/bin/which per tool
+        if shutil.which(cmd):
             print_success(f"{name} is installed")
         else:
             print_error(f"{name} is NOT installed")
@@ -196,8 +294,79 @@ def check_prerequisites(for_restore=False):
         return ask_yes_no("\nContinue with setup?")
     return True
 
-def create_env_file():
-    """Create or verify .env file."""
+def write_private_file(file_path: Path, content: str):
+    """
+    Write content to file_path readable only by its owner.
+    
+    The file is created with mode 600 so secrets are never exposed with the
+    umask default, written with a single os.write, and chowned to the real
+    user via its descriptor when running as root.
+    """
+    fd = os.open(str(file_path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        # O_CREAT's mode does not apply to an existing file
+        os.fchmod(fd, 0o600)
+        if is_running_as_root():
+            real_user, real_uid, real_gid = get_real_user()
+            os.fchown(fd, real_uid, real_gid)
+        
+        # A memoryview lets a short write resume without copying the remainder
+        data = memoryview(content.encode('utf-8'))
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+# (key, .env setting, label, default) for the PostgreSQL connection prompts, in the
+# order asked; a default of None is not shown (the password)
+_PG_PROMPTS = (
+    ('host', 'PGHOST', 'PostgreSQL host', 'localhost'),
+    ('port', 'PGPORT', 'PostgreSQL port', '5432'),
+    ('user', 'PGUSER', 'PostgreSQL user', 'alfresco'),
+    ('password', 'PGPASSWORD', 'PostgreSQL password', None),
+    ('database', 'PGDATABASE', 'PostgreSQL database', 'postgres'),
+)
+
+def prompt_line(label: str, default: Optional[str] = None, key: Optional[str] = None,
+                required: bool = False) -> str:
+    """
+    Prompt for one line of input, showing default in brackets when given.
+    A non-empty --config answer for the .env setting key is returned without
+    prompting. With --non-interactive, nothing is read: an empty string is
+    returned (callers apply their defaults), or setup exits if required.
+    """
+    if key and _PRESET_ANSWERS.get(key):
+        return _PRESET_ANSWERS[key]
+    
+    if _NON_INTERACTIVE:
+        if required:
+            print_error(f"{label} is required: set {key} in the --config file")
+            sys.exit(1)
+        return ''
+    
+    shown = f"{label} [{default}]" if default is not None else label
+    return _read_line(f"{shown}: ")
+
+def prompt_db_settings(detected: dict) -> tuple:
+    """
+    Ask for the PostgreSQL connection settings, using detected values as defaults.
+    Returns: (host, port, user, password, database)
+    """
+    answers = []
+    for key, env_key, label, default in _PG_PROMPTS:
+        # The password is never echoed as a default, but still falls back to the detected one
+        default_value = detected.get(key, default if default is not None else '')
+        shown_default = default_value if default is not None else None
+        answers.append(prompt_line(label, shown_default, key=env_key) or default_value)
+    
+    return tuple(answers)
+
+def create_env_file() -> Optional[dict]:
+    """
+    Create or verify .env file.
+    Returns the settings now in .env, so later steps need not re-read it,
+    or None if it was not created.
+    """
     print_header("Step 2: Environment Configuration")
     
     env_file = Path('.env')
@@ -205,8 +374,9 @@ def create_env_file():
     
     if env_file.exists():
         print_info(f".env file already exists at: {env_file.absolute()}")
-        if not ask_yes_no("Do you want to reconfigure it?", default=False):
-            return True
+        # Answers passed with --config mean the user wants them applied
+        if not ask_yes_no("Do you want to reconfigure it?", default=bool(_PRESET_ANSWERS)):
+            return load_env_config()
     
     print_info("\nThe .env file contains all configuration for the backup system.")
     print_info("You need to provide:")
@@ -218,7 +388,7 @@ def create_env_file():
     
     if not ask_yes_no("\nCreate/update .env file now?"):
         print_warning("Skipping .env creation. You must create it manually before running backups.")
-        return False
+        return None
     
     # Collect backup destination first
     print_info("\n--- Backup Destination ---")
@@ -226,7 +396,8 @@ def create_env_file():
     print_info("  1. Local directory (traditional backup to disk)")
     print_info("  2. S3 bucket (cloud backup, requires rclone)")
     
-    backup_destination = input(f"{Colors.OKCYAN}Backup destination (1 or 2) [1]: {Colors.ENDC}").strip() or '1'
+    default_destination = '2' if _PRESET_ANSWERS.get('S3_BUCKET') else '1'
+    backup_destination = prompt_line("Backup destination (1 or 2)", default_destination) or default_destination
     
     backup_dir = None
     s3_bucket = None
@@ -249,7 +420,7 @@ def create_env_file():
                     print_info("  sudo apt-get install -y rclone")
                     print_info("\nOr install from: https://rclone.org/install/")
                     if not ask_yes_no("Continue without rclone? (S3 backups will fail)", default=False):
-                        return False
+                        return None
             else:
                 print_warning("rclone is required for S3 backups")
                 print_info("Install it manually with:")
@@ -257,22 +428,22 @@ def create_env_file():
                 print("  sudo apt-get install -y rclone")
                 print("\nOr install from: https://rclone.org/install/")
                 if not ask_yes_no("Continue without rclone? (S3 backups will fail)", default=False):
-                    return False
+                    return None
         
         while True:
-            s3_bucket = input(f"{Colors.OKCYAN}S3 bucket name: {Colors.ENDC}").strip()
+            s3_bucket = prompt_line("S3 bucket name", key='S3_BUCKET', required=True)
             if s3_bucket:
                 break
             print_error("S3 bucket name is required for S3 backup")
         
-        s3_region = input(f"{Colors.OKCYAN}S3 region [us-east-1]: {Colors.ENDC}").strip() or 'us-east-1'
+        s3_region = prompt_line("S3 region", 'us-east-1', key='S3_REGION') or 'us-east-1'
         while True:
-            aws_access_key_id = input(f"{Colors.OKCYAN}AWS Access Key ID: {Colors.ENDC}").strip()
+            aws_access_key_id = prompt_line("AWS Access Key ID", key='AWS_ACCESS_KEY_ID', required=True)
             if aws_access_key_id:
                 break
             print_error("AWS Access Key ID is required")
         while True:
-            aws_secret_access_key = input(f"{Colors.OKCYAN}AWS Secret Access Key: {Colors.ENDC}").strip()
+            aws_secret_access_key = prompt_line("AWS Secret Access Key", key='AWS_SECRET_ACCESS_KEY', required=True)
             if aws_secret_access_key:
                 break
             print_error("AWS Secret Access Key is required")
@@ -280,19 +451,27 @@ def create_env_file():
         # Local backup
         print_info("\n--- Local Backup Directory ---")
         while True:
-            backup_dir = input(f"{Colors.OKCYAN}Backup directory path: {Colors.ENDC}").strip()
-            if backup_dir and Path(backup_dir).exists():
+            backup_dir = prompt_line("Backup directory path", key='BACKUP_DIR', required=True)
+            if backup_dir and os.path.isdir(backup_dir):
                 break
             print_error(f"Directory does not exist: {backup_dir}")
+            if _NON_INTERACTIVE:
+                return None
+            # Ask again instead of re-reading the same invalid --config answer
+            _PRESET_ANSWERS.pop('BACKUP_DIR', None)
             print_info("Please enter a valid backup directory path.")
     
     # Collect Alfresco base directory (needed for auto-detection)
     print_info("\n--- Alfresco Base Directory ---")
     while True:
-        alf_base_dir = input(f"{Colors.OKCYAN}Alfresco base directory path: {Colors.ENDC}").strip()
-        if alf_base_dir and Path(alf_base_dir).exists():
+        alf_base_dir = prompt_line("Alfresco base directory path", key='ALF_BASE_DIR', required=True)
+        if alf_base_dir and os.path.isdir(alf_base_dir):
             break
         print_error(f"Directory does not exist: {alf_base_dir}")
+        if _NON_INTERACTIVE:
+            return None
+        # Ask again instead of re-reading the same invalid --config answer
+        _PRESET_ANSWERS.pop('ALF_BASE_DIR', None)
         print_info("Please enter a valid Alfresco base directory path.")
     
     # Try to auto-detect database settings from alfresco-global.properties
@@ -307,7 +486,9 @@ def create_env_file():
         print_info(f"  User: {db_settings.get('user', 'not found')}")
         print_info(f"  Database: {db_settings.get('database', 'not found')}")
         
-        use_detected = ask_yes_no("Use these detected settings?", default=True)
+        # PostgreSQL answers given with --config take precedence over detection
+        preset_db = any(_PRESET_ANSWERS.get(env_key) for key, env_key, label, default in _PG_PROMPTS)
+        use_detected = ask_yes_no("Use these detected settings?", default=not preset_db)
         
         if use_detected:
             pg_host = db_settings.get('host', 'localhost')
@@ -319,47 +500,37 @@ def create_env_file():
             # For backup, we typically use 'postgres' database, but allow override
             if pg_database != 'postgres':
                 print_info(f"\nNote: Detected database '{pg_database}', but backups typically use 'postgres' database.")
-                override_db = input(f"{Colors.OKCYAN}PostgreSQL database for backup [{pg_database}]: {Colors.ENDC}").strip()
+                override_db = prompt_line("PostgreSQL database for backup", pg_database, key='PGDATABASE')
                 if override_db:
                     pg_database = override_db
         else:
             # Manual entry with detected values as defaults
-            pg_host = input(f"{Colors.OKCYAN}PostgreSQL host [{db_settings.get('host', 'localhost')}]: {Colors.ENDC}").strip() or db_settings.get('host', 'localhost')
-            pg_port = input(f"{Colors.OKCYAN}PostgreSQL port [{db_settings.get('port', '5432')}]: {Colors.ENDC}").strip() or db_settings.get('port', '5432')
-            pg_user = input(f"{Colors.OKCYAN}PostgreSQL user [{db_settings.get('user', 'alfresco')}]: {Colors.ENDC}").strip() or db_settings.get('user', 'alfresco')
-            pg_password = input(f"{Colors.OKCYAN}PostgreSQL password: {Colors.ENDC}").strip()
-            if not pg_password:
-                pg_password = db_settings.get('password', '')
-            pg_database = input(f"{Colors.OKCYAN}PostgreSQL database [{db_settings.get('database', 'postgres')}]: {Colors.ENDC}").strip() or db_settings.get('database', 'postgres')
+            pg_host, pg_port, pg_user, pg_password, pg_database = prompt_db_settings(db_settings)
     else:
         print_warning("Could not auto-detect database settings. Please enter manually.")
-        pg_host = input(f"{Colors.OKCYAN}PostgreSQL host [localhost]: {Colors.ENDC}").strip() or 'localhost'
-        pg_port = input(f"{Colors.OKCYAN}PostgreSQL port [5432]: {Colors.ENDC}").strip() or '5432'
-        pg_user = input(f"{Colors.OKCYAN}PostgreSQL user [alfresco]: {Colors.ENDC}").strip() or 'alfresco'
-        pg_password = input(f"{Colors.OKCYAN}PostgreSQL password: {Colors.ENDC}").strip()
-        pg_database = input(f"{Colors.OKCYAN}PostgreSQL database [postgres]: {Colors.ENDC}").strip() or 'postgres'
+        pg_host, pg_port, pg_user, pg_password, pg_database = prompt_db_settings({})
     default_superuser = pg_user if pg_user else 'postgres'
-    pg_superuser = input(
-        f"{Colors.OKCYAN}PostgreSQL superuser (for granting privileges) [{default_superuser}]: {Colors.ENDC}"
-    ).strip() or default_superuser
+    pg_superuser = prompt_line(
+        "PostgreSQL superuser (for granting privileges)", default_superuser, key='PGSUPERUSER'
+    ) or default_superuser
     
     # Auto-detect PostgreSQL system user
     pg_system_user = get_postgres_user()
     if pg_system_user:
         print_info(f"Auto-detected PostgreSQL system user: {pg_system_user}")
     else:
-        pg_system_user = input(f"{Colors.OKCYAN}PostgreSQL system user [postgres]: {Colors.ENDC}").strip() or 'postgres'
+        pg_system_user = prompt_line("PostgreSQL system user", 'postgres', key='PG_SYSTEM_USER') or 'postgres'
     
     print_info("\n--- Retention Policy ---")
-    retention_days = input(f"{Colors.OKCYAN}Retention period in days [7]: {Colors.ENDC}").strip() or '7'
+    retention_days = prompt_line("Retention period in days", '7', key='RETENTION_DAYS') or '7'
     
     print_info("\n--- Customer Name (optional) ---")
     print_info("Customer name will be displayed prominently in email alerts")
-    customer_name = input(f"{Colors.OKCYAN}Customer name (for email alerts): {Colors.ENDC}").strip()
+    customer_name = prompt_line("Customer name (for email alerts)", key='CUSTOMER_NAME')
     
     print_info("\n--- Contentstore Backup Timeout (optional) ---")
     print_info("For large contentstores, you may need to increase this timeout")
-    timeout_hours = input(f"{Colors.OKCYAN}Contentstore backup timeout in hours [24]: {Colors.ENDC}").strip() or '24'
+    timeout_hours = prompt_line("Contentstore backup timeout in hours", '24', key='CONTENTSTORE_TIMEOUT_HOURS') or '24'
     try:
         timeout_hours_int = int(timeout_hours)
         if timeout_hours_int < 1:
@@ -373,7 +544,7 @@ def create_env_file():
     print_info("For large backups (5TB+), use 4-8 threads for 2-4x speedup")
     print_info("Each thread processes one top-level directory (typically year directories)")
     print_info("Set to 1 to disable parallelization (slower but simpler)")
-    parallel_threads = input(f"{Colors.OKCYAN}Number of parallel threads [4]: {Colors.ENDC}").strip() or '4'
+    parallel_threads = prompt_line("Number of parallel threads", '4', key='CONTENTSTORE_PARALLEL_THREADS') or '4'
     try:
         parallel_threads_int = int(parallel_threads)
         if parallel_threads_int < 1:
@@ -387,14 +558,14 @@ def create_env_file():
         parallel_threads = '4'
     
     print_info("\n--- Email Alerts (optional) ---")
-    configure_email = ask_yes_no("Configure email alerts?", default=False)
+    configure_email = ask_yes_no("Configure email alerts?", default=bool(_PRESET_ANSWERS.get('ALERT_EMAIL')))
     
     if configure_email:
         print_info("\nEmail alert mode:")
         print_info("  - 'both': Send emails on both successful and failed backups")
         print_info("  - 'failure_only': Send emails only on failed backups (default)")
         print_info("  - 'none': Disable email alerts")
-        email_alert_mode_input = input(f"{Colors.OKCYAN}Email alert mode [failure_only]: {Colors.ENDC}").strip().lower()
+        email_alert_mode_input = prompt_line("Email alert mode", 'failure_only', key='EMAIL_ALERT_MODE').lower()
         if email_alert_mode_input not in ['both', 'failure_only', 'none']:
             if email_alert_mode_input:
                 print_warning(f"Invalid mode '{email_alert_mode_input}', using 'failure_only'")
@@ -402,12 +573,12 @@ def create_env_file():
         else:
             email_alert_mode = email_alert_mode_input
         
-        smtp_host = input(f"{Colors.OKCYAN}SMTP host [smtp.gmail.com]: {Colors.ENDC}").strip() or 'smtp.gmail.com'
-        smtp_port = input(f"{Colors.OKCYAN}SMTP port [587]: {Colors.ENDC}").strip() or '587'
-        smtp_user = input(f"{Colors.OKCYAN}SMTP username: {Colors.ENDC}").strip()
-        smtp_password = input(f"{Colors.OKCYAN}SMTP password: {Colors.ENDC}").strip()
-        alert_email = input(f"{Colors.OKCYAN}Alert recipient email: {Colors.ENDC}").strip()
-        alert_from = input(f"{Colors.OKCYAN}Alert from email [{smtp_user}]: {Colors.ENDC}").strip() or smtp_user
+        smtp_host = prompt_line("SMTP host", 'smtp.gmail.com', key='SMTP_HOST') or 'smtp.gmail.com'
+        smtp_port = prompt_line("SMTP port", '587', key='SMTP_PORT') or '587'
+        smtp_user = prompt_line("SMTP username", key='SMTP_USER')
+        smtp_password = prompt_line("SMTP password", key='SMTP_PASSWORD')
+        alert_email = prompt_line("Alert recipient email", key='ALERT_EMAIL')
+        alert_from = prompt_line("Alert from email", smtp_user, key='ALERT_FROM') or smtp_user
     else:
         email_alert_mode = 'failure_only'
         smtp_host = smtp_port = smtp_user = smtp_password = alert_email = alert_from = ''
@@ -464,43 +635,53 @@ ALERT_EMAIL={alert_email}
 ALERT_FROM={alert_from}
 """
     
-    with open(env_file, 'w') as f:
-        f.write(env_content)
-    
-    # Set ownership if running as root
-    if is_running_as_root():
-        real_user, real_uid, real_gid = get_real_user()
-        os.chown(env_file, real_uid, real_gid)
-    
-    os.chmod(env_file, 0o600)  # Secure the file
+    write_private_file(env_file, env_content)
     
     print_success(f"\n.env file created at: {env_file.absolute()}")
     print_success("File permissions set to 600 (read/write for owner only)")
     
-    return True
+    # Parsed from the text just written, so it matches what load_env_config() would return
+    return _parse_env_text(env_content)
+
+def _parse_env_text(text: str) -> dict:
+    """Parse KEY=VALUE lines in .env format, skipping blank and comment lines."""
+    config = {}
+    
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        key, sep, value = line.partition('=')
+        if sep:
+            config[key.strip()] = value.strip()
+    
+    return config
+
+@functools.lru_cache(maxsize=8)
+def _parse_env(path: str, mtime_ns: int, size: int) -> dict:
+    """Parse a .env file; cached per path, modification time and size."""
+    # One read of the small file, then partition each line in memory
+    return _parse_env_text(Path(path).read_text())
 
 def load_env_config() -> dict:
     """Load configuration from .env file."""
-    config = {}
     env_file = Path('.env')
     
-    if not env_file.exists():
-        return config
-    
-    with open(env_file, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                key, value = line.split('=', 1)
-                config[key.strip()] = value.strip()
+    try:
+        st = env_file.stat()
+    except FileNotFoundError:
+        return {}
     
-    return config
+    # Keyed on mtime and size so a rewrite by create_env_file() invalidates the
+    # cache; return a copy so callers cannot alter the cached dict
+    return dict(_parse_env(str(env_file.absolute()), st.st_mtime_ns, st.st_size))
 
-def create_directories():
+def create_directories(config: Optional[dict] = None):
     """Create backup directories."""
     print_header("Step 3: Create Backup Directories")
     
-    config = load_env_config()
+    if config is None:
+        config = load_env_config()
     s3_enabled = bool(config.get('S3_BUCKET'))
     
     if s3_enabled:
@@ -530,85 +711,110 @@ def create_directories():
         print_warning("Skipping directory creation")
         return False
     
+    backup_path = Path(backup_dir)
+    
     try:
-        # Create main backup directory
-        if running_as_root:
-            # We have root privileges, create directly
-            Path(backup_dir).mkdir(parents=True, exist_ok=True)
-            print_success(f"Created: {backup_dir}")
-            
-            # Set ownership to real user
-            os.chown(backup_dir, real_uid, real_gid)
-            print_success(f"Set ownership to {real_user}")
-        else:
-            # Try to create without sudo first
-            try:
-                Path(backup_dir).mkdir(parents=True, exist_ok=True)
-                print_success(f"Created: {backup_dir}")
-            except PermissionError:
-                # Need sudo to create parent directories
-                print_warning(f"Permission denied creating {backup_dir}")
-                print_info(f"\nNeed sudo access to create directory in {Path(backup_dir).parent}")
-                print_info("Please re-run this script with sudo:")
-                print_info(f"  sudo python3 setup.py")
-                return False
-        
-        # Create subdirectories
-        for subdir in ['postgres', 'contentstore']:
-            path = Path(backup_dir) / subdir
-            path.mkdir(exist_ok=True)
+        # Create the main backup directory and its subdirectories in one pass
+        for path in (backup_path, backup_path / 'postgres', backup_path / 'contentstore'):
+            path.mkdir(parents=True, exist_ok=True)
             if running_as_root:
-                os.chown(path, real_uid, real_gid)
+                # Set ownership to real user through the directory descriptor
+                fd = os.open(str(path), os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fchown(fd, real_uid, real_gid)
+                finally:
+                    os.close(fd)
             print_success(f"Created: {path}")
         
-        return True
+        if running_as_root:
+            print_success(f"Set ownership to {real_user}")
         
+        return True
+    
+    except PermissionError as e:
+        if running_as_root:
+            print_error(f"Error creating directories: {e}")
+            return False
+        # Need sudo to create parent directories
+        print_warning(f"Permission denied creating {backup_dir}")
+        print_info(f"\nNeed sudo access to create directory in {backup_path.parent}")
+        print_info("Please re-run this script with sudo:")
+        print_info(f"  sudo python3 setup.py")
+        return False
     except Exception as e:
         print_error(f"Error creating directories: {e}")
         return False
 
+def cached_stat(path) -> Optional[os.stat_result]:
+    """
+    Return os.stat(path), or None if it cannot be stat'ed, remembering the result.
+    The wizard probes the same handful of paths repeatedly; callers that create
+    or remove a probed path must call forget_stat() afterwards.
+    """
+    key = str(path)
+    if key in _STAT_CACHE:
+        return _STAT_CACHE[key]
+    
+    try:
+        result = os.stat(key)
+    except OSError:
+        result = None
+    _STAT_CACHE[key] = result
+    return result
+
+def cached_exists(path) -> bool:
+    """Return True if path exists, using cached_stat()."""
+    return cached_stat(path) is not None
+
+def forget_stat(path):
+    """Drop path from the stat cache after it has been created or removed."""
+    _STAT_CACHE.pop(str(path), None)
+
+def _first_existing_path(base_dir: str, candidates: tuple) -> Optional[str]:
+    """Return the first candidate under base_dir that exists, probing each with a cached stat."""
+    for relative_path in candidates:
+        path = os.path.join(base_dir, relative_path)
+        if cached_exists(path):
+            return path
+    
+    return None
+
+@functools.lru_cache(maxsize=8)
+def _parse_db_properties(path: str, mtime_ns: int, size: int) -> dict:
+    """Read the db.* entries of a properties file; cached per path, modification time and size."""
+    properties = {}
+    
+    for line in Path(path).read_text(encoding='utf-8').splitlines():
+        # Comments, blank lines and lines without '=' do not match
+        match = _PROP_RE.match(line)
+        if not match:
+            continue
+        
+        key, value = match.group(1), match.group(2)
+        # Only database settings are used
+        if not key.startswith('db.'):
+            continue
+        
+        # Remove quotes if present
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in ('"', "'"):
+            value = value[1:-1]
+        
+        properties[key] = value
+    
+    return properties
+
 def parse_alfresco_global_properties(alf_base_dir: str) -> Optional[dict]:
     """Parse alfresco-global.properties and extract database connection settings."""
-    alf_base_path = Path(alf_base_dir)
-    
     # Try common locations for alfresco-global.properties
-    possible_paths = [
-        alf_base_path / 'tomcat' / 'shared' / 'classes' / 'alfresco-global.properties',
-        alf_base_path / 'alf_data' / 'tomcat' / 'shared' / 'classes' / 'alfresco-global.properties',
-    ]
-    
-    props_file = None
-    for path in possible_paths:
-        if path.exists():
-            props_file = path
-            break
+    props_file = _first_existing_path(alf_base_dir, _ALFRESCO_GLOBAL_PROPERTIES_PATHS)
     
     if not props_file:
         return None
     
     try:
-        properties = {}
-        
-        with open(props_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                # Skip comments and empty lines
-                if not line or line.startswith('#'):
-                    continue
-                
-                # Parse key=value pairs
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    key = key.strip()
-                    value = value.strip()
-                    
-                    # Remove quotes if present
-                    if value.startswith('"') and value.endswith('"'):
-                        value = value[1:-1]
-                    elif value.startswith("'") and value.endswith("'"):
-                        value = value[1:-1]
-                    
-                    properties[key] = value
+        # Re-parsed only when the file changes between wizard steps
+        st = os.stat(props_file)
+        properties = _parse_db_properties(props_file, st.st_mtime_ns, st.st_size)
         
         # Extract database settings
         db_settings = {}
@@ -630,8 +836,7 @@ def parse_alfresco_global_properties(alf_base_dir: str) -> Optional[dict]:
                 db_url = db_url.replace('${db.name}', properties['db.name'])
             
             # Parse jdbc:postgresql://host:port/database
-            import re
-            match = re.search(r'jdbc:postgresql://([^:]+):?(\d+)?/(.+)', db_url)
+            match = _JDBC_PG_RE.search(db_url)
             if match:
                 db_settings['host'] = match.group(1)
                 db_settings['port'] = match.group(2) or '5432'
@@ -654,7 +859,7 @@ def detect_db_settings_from_alfresco(alf_base_dir: Optional[str] = None) -> Opti
         
         if not alf_base_dir:
             # Ask for alf_base_dir first
-            alf_base_dir = input(f"{Colors.OKCYAN}Alfresco base directory: {Colors.ENDC}").strip()
+            alf_base_dir = prompt_line("Alfresco base directory", key='ALF_BASE_DIR')
     
     if not alf_base_dir or not Path(alf_base_dir).exists():
         return None
@@ -680,23 +885,24 @@ def get_postgres_user() -> Optional[str]:
     common_users = ['postgres', 'postgresql', 'pgsql', real_user]
     
     for user in common_users:
+        # getpwnam resolves the account in-process instead of forking /usr/bin/id
         try:
-            result = run_command(['id', user], capture_output=True, check=False)
-            if result and result.returncode == 0:
-                print_info(f"Found PostgreSQL user: {user}")
-                return user
-        except:
+            pwd.getpwnam(user)
+        except KeyError:
             continue
+        print_info(f"Found PostgreSQL user: {user}")
+        return user
     
     # If we get here, use the real user as fallback for embedded PostgreSQL
     print_info(f"Using detected user for embedded PostgreSQL: {real_user}")
     return real_user
 
-def configure_wal_archive():
+def configure_wal_archive(config: Optional[dict] = None):
     """Help configure WAL archive directory for PostgreSQL."""
     print_header("Step 4: Configure WAL Archive Directory for PostgreSQL")
     
-    config = load_env_config()
+    if config is None:
+        config = load_env_config()
     s3_enabled = bool(config.get('S3_BUCKET'))
     
     if s3_enabled:
@@ -750,7 +956,6 @@ def configure_wal_archive():
     
     try:
         # Get postgres user UID
-        import pwd
         try:
             pg_pw_record = pwd.getpwnam(pg_user)
             pg_uid = pg_pw_record.pw_uid
@@ -758,38 +963,28 @@ def configure_wal_archive():
             print_error(f"Could not find UID for user: {pg_user}")
             return False
         
-        # Change ownership
         if running_as_root:
-            # We already have root, use os.chown directly
+            # We already have root, use os.chown/os.chmod directly
             print_info(f"\nSetting ownership to {pg_user}:{real_user}")
             os.chown(wal_dir, pg_uid, real_gid)
             print_success(f"Set ownership to {pg_user}:{real_user}")
-        else:
-            # Need sudo
-            print_info(f"\nRunning: sudo chown {pg_user}:{real_user} {wal_dir}")
-            result = run_command(['sudo', 'chown', f'{pg_user}:{real_user}', str(wal_dir)], capture_output=True, check=False)
             
-            if result and result.returncode == 0:
-                print_success(f"Set ownership to {pg_user}:{real_user}")
-            else:
-                print_error(f"Failed to set ownership")
-                if result and result.stderr:
-                    print_error(f"Error: {result.stderr.strip()}")
-                return False
-        
-        # Change permissions
-        if running_as_root:
             print_info("Setting permissions to 770")
             os.chmod(wal_dir, 0o770)
             print_success("Set permissions to 770")
         else:
-            print_info(f"Running: sudo chmod 770 {wal_dir}")
-            result = run_command(['sudo', 'chmod', '770', str(wal_dir)], capture_output=True, check=False)
+            # Need sudo - run chown and chmod in one shell so sudo is only invoked once
+            quoted_dir = shlex.quote(str(wal_dir))
+            owner = shlex.quote(f'{pg_user}:{real_user}')
+            script = f'chown {owner} {quoted_dir} && chmod 770 {quoted_dir}'
+            print_info(f"\nRunning: sudo sh -c \"{script}\"")
+            result = run_command(['sudo', 'sh', '-c', script], check=False, discard_output=True)
             
             if result and result.returncode == 0:
+                print_success(f"Set ownership to {pg_user}:{real_user}")
                 print_success("Set permissions to 770")
             else:
-                print_error("Failed to set permissions")
+                print_error("Failed to set ownership and permissions")
                 if result and result.stderr:
                     print_error(f"Error: {result.stderr.strip()}")
                 return False
@@ -800,113 +995,191 @@ def configure_wal_archive():
         print_error(f"Error configuring WAL directory: {e}")
         return False
 
-def find_postgresql_conf(alf_base_dir: str) -> Optional[Path]:
-    """Find postgresql.conf file for Alfresco embedded PostgreSQL."""
-    # Try common locations for Alfresco embedded PostgreSQL
-    possible_paths = [
-        Path(alf_base_dir) / 'postgresql' / 'postgresql.conf',
-        Path(alf_base_dir) / 'alf_data' / 'postgresql' / 'postgresql.conf',
-    ]
-    
-    for path in possible_paths:
-        if path.exists():
-            return path
+@functools.lru_cache(maxsize=8)
+def _dir_entry_names(dir_path: str) -> Optional[frozenset]:
+    """
+    Names in dir_path from a single scandir; cached per path.
+    Returns an empty set for a missing directory and None when it cannot be
+    listed, so callers can fall back to probing individual files.
+    """
+    try:
+        with os.scandir(dir_path) as entries:
+            return frozenset(entry.name for entry in entries)
+    except PermissionError:
+        return None
+    except OSError:
+        return frozenset()
+
+def _find_in_postgresql_dirs(alf_base_dir: str, filename: str) -> Optional[Path]:
+    """Return the first embedded PostgreSQL directory's filename that exists."""
+    for relative_dir in _POSTGRESQL_DIRS:
+        dir_path = os.path.join(alf_base_dir, relative_dir)
+        names = _dir_entry_names(dir_path)
+        if names is None:
+            # Searchable but unreadable directory: stat the file itself
+            path = os.path.join(dir_path, filename)
+            if cached_exists(path):
+                return Path(path)
+        elif filename in names:
+            return Path(dir_path) / filename
     
     return None
 
+@functools.lru_cache(maxsize=4)
+def find_postgresql_conf(alf_base_dir: str) -> Optional[Path]:
+    """Find postgresql.conf file for Alfresco embedded PostgreSQL; cached per ALF_BASE_DIR."""
+    # Try common locations for Alfresco embedded PostgreSQL; the directory
+    # listings are shared with find_pg_hba_conf()
+    return _find_in_postgresql_dirs(alf_base_dir, 'postgresql.conf')
+
+@functools.lru_cache(maxsize=4)
 def find_pg_hba_conf(alf_base_dir: str) -> Optional[Path]:
-    """Find pg_hba.conf file for Alfresco embedded PostgreSQL."""
+    """Find pg_hba.conf file for Alfresco embedded PostgreSQL; cached per ALF_BASE_DIR."""
     # Try common locations for Alfresco embedded PostgreSQL
-    possible_paths = [
-        Path(alf_base_dir) / 'postgresql' / 'pg_hba.conf',
-        Path(alf_base_dir) / 'alf_data' / 'postgresql' / 'pg_hba.conf',
-    ]
-    
-    for path in possible_paths:
-        if path.exists():
-            return path
-    
-    return None
+    return _find_in_postgresql_dirs(alf_base_dir, 'pg_hba.conf')
 
-def backup_file(file_path: Path) -> bool:
-    """Create a backup of a file with .backup extension."""
+def backup_file(file_path: Path, hardlink: bool = False) -> bool:
+    """
+    Create a backup of a file with .backup extension.
+    With hardlink=True the backup is a hard link instead of a copy; only use
+    this for files that are later replaced (see _atomic_rewrite), never
+    modified in place, or the backup would change with them.
+    """
     backup_path = Path(str(file_path) + '.backup')
     
-    if backup_path.exists():
+    if cached_exists(backup_path):
         print_info(f"Backup already exists: {backup_path}")
         return True
     
     try:
-        shutil.copy2(file_path, backup_path)
+        linked = False
+        if hardlink:
+            try:
+                os.link(file_path, backup_path)
+                linked = True
+            except OSError as e:
+                # Cross-device or link-restricted filesystems fall back to copying
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                    raise
+        if not linked:
+            shutil.copy2(file_path, backup_path)
+        forget_stat(backup_path)
         print_success(f"Created backup: {backup_path}")
         return True
     except Exception as e:
         print_error(f"Failed to create backup: {e}")
         return False
 
-def update_postgresql_conf_setting(file_path: Path, setting: str, value: str, wal_dir: str = None) -> bool:
-    """Update or add a setting in postgresql.conf."""
+@contextlib.contextmanager
+def _atomic_rewrite(file_path: Path):
+    """
+    Yield a text file that replaces file_path when the block completes.
+    The replacement is written next to the original with the same mode (and
+    ownership when running as root), then moved over it with os.replace, so a
+    crash never leaves a half-written config. It is discarded on error.
+    """
+    tmp_path = file_path.with_name(file_path.name + '.tmp')
+    st = os.stat(file_path)
+    
     try:
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
-        
-        # Replace %p and %f placeholders in archive_command if needed
-        if setting == 'archive_command' and wal_dir:
-            value = value.replace('%WAL_DIR%', wal_dir)
-        
-        setting_found = False
-        new_lines = []
-        
-        for line in lines:
-            stripped = line.strip()
-            
-            # Check if this line contains our setting
-            if stripped.startswith(setting + ' ') or stripped.startswith(setting + '=') or stripped.startswith('#' + setting):
-                if not setting_found:
+        with open(tmp_path, 'w') as f:
+            os.fchmod(f.fileno(), st.st_mode & 0o7777)
+            if is_running_as_root():
+                os.fchown(f.fileno(), st.st_uid, st.st_gid)
+            yield f
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        raise
+
+def update_postgresql_conf_settings(file_path: Path, settings: list, wal_dir: str = None) -> bool:
+    """
+    Update or add several settings in postgresql.conf in a single pass.
+    settings is a list of (setting, value) pairs; each is replaced at its first
+    active or commented-out occurrence, duplicates are dropped, and settings
+    not present are appended at the end in the order given.
+    """
+    try:
+        values = {}
+        for setting, value in settings:
+            # Replace %p and %f placeholders in archive_command if needed
+            if setting == 'archive_command' and wal_dir:
+                value = value.replace('%WAL_DIR%', wal_dir)
+            values[setting] = value
+        
+        # Active or commented-out occurrences of each setting, checked in one startswith call
+        prefixes = {setting: (setting + ' ', setting + '=', '#' + setting) for setting in values}
+        # Finds lines that mention any of the settings at all
+        names_re = re.compile('|'.join(re.escape(setting) for setting in values))
+        found = set()
+        
+        # Stream the file into its replacement one line at a time
+        with open(file_path, 'r') as f_in, _atomic_rewrite(file_path) as f_out:
+            for line in f_in:
+                # Most lines do not mention any setting; forward them
+                # without stripping or prefix checks
+                if not names_re.search(line):
+                    f_out.write(line)
+                    continue
+                
+                stripped = line.strip()
+                
+                # Check which of our settings this line contains, if any
+                setting = next((name for name, name_prefixes in prefixes.items() if stripped.startswith(name_prefixes)), None)
+                if setting is None:
+                    f_out.write(line)
+                elif setting not in found:
                     # Replace with our value
-                    new_lines.append(f"{setting} = {value}\n")
-                    setting_found = True
-                    print_info(f"  Updated: {setting} = {value}")
+                    f_out.write(f"{setting} = {values[setting]}\n")
+                    found.add(setting)
+                    print_info(f"  Updated: {setting} = {values[setting]}")
                 # Skip duplicate lines
-            else:
-                new_lines.append(line)
-        
-        # If setting wasn't found, add it at the end
-        if not setting_found:
-            new_lines.append(f"\n# Added by backup setup script\n")
-            new_lines.append(f"{setting} = {value}\n")
-            print_info(f"  Added: {setting} = {value}")
-        
-        # Write back
-        with open(file_path, 'w') as f:
-            f.writelines(new_lines)
+            
+            # Add settings that weren't found at the end
+            missing = [setting for setting in values if setting not in found]
+            if missing:
+                f_out.write("\n# Added by backup setup script\n")
+                for setting in missing:
+                    f_out.write(f"{setting} = {values[setting]}\n")
+                    print_info(f"  Added: {setting} = {values[setting]}")
         
         return True
         
     except Exception as e:
-        print_error(f"Failed to update {setting}: {e}")
+        print_error(f"Failed to update postgresql.conf: {e}")
         return False
 
 def update_pg_hba_conf(file_path: Path, pg_user: str) -> bool:
     """Add replication entries to pg_hba.conf if not already present."""
     try:
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
-        
         # Check for each specific entry type
         has_local = False
         has_ipv4 = False
         has_ipv6 = False
         
-        for line in lines:
-            if line.strip().startswith('#'):
-                continue
-            if f"local   replication     {pg_user}" in line:
-                has_local = True
-            if f"host    replication     {pg_user}        127.0.0.1/32" in line:
-                has_ipv4 = True
-            if f"host    replication     {pg_user}        ::1/128" in line:
-                has_ipv6 = True
+        # Leading columns of the entries we look for; tokenizing tolerates any
+        # column spacing, and comment lines never match
+        local_entry = ('local', 'replication', pg_user)
+        host_entry = ('host', 'replication', pg_user)
+        
+        # Stream the file; existing lines are never rewritten, only appended to
+        with open(file_path, 'r') as f:
+            for line in f:
+                parts = line.split(None, 4)
+                columns = tuple(parts[:3])
+                if columns == local_entry:
+                    has_local = True
+                elif columns == host_entry and len(parts) > 3:
+                    if parts[3] == '127.0.0.1/32':
+                        has_ipv4 = True
+                    elif parts[3] == '::1/128':
+                        has_ipv6 = True
+                else:
+                    continue
+                # Already-configured files stop reading at the last entry found
+                if has_local and has_ipv4 and has_ipv6:
+                    break
         
         # Check if all entries exist
         if has_local and has_ipv4 and has_ipv6:
@@ -914,7 +1187,7 @@ def update_pg_hba_conf(file_path: Path, pg_user: str) -> bool:
             return True
         
         # Add missing entries
-        new_lines = lines.copy()
+        new_lines = []
         entries_added = []
         
         if not has_local and not has_ipv4 and not has_ipv6:
@@ -936,8 +1209,9 @@ def update_pg_hba_conf(file_path: Path, pg_user: str) -> bool:
             new_lines.append(f"host    replication     {pg_user}        ::1/128                 md5\n")
             entries_added.append("IPv6")
         
-        with open(file_path, 'w') as f:
-            f.writelines(new_lines)
+        # Append all missing entries with a single write
+        with open(file_path, 'a') as f:
+            f.write(''.join(new_lines))
         
         print_info(f"  Added replication entries for {pg_user}: {', '.join(entries_added)}")
         return True
@@ -951,17 +1225,16 @@ def detect_postgresql_version(pg_conf: Path) -> tuple:
     # Try to read version from config file comments or nearby files
     version_file = pg_conf.parent / 'PG_VERSION'
     
-    if version_file.exists():
-        try:
-            with open(version_file, 'r') as f:
-                version_str = f.read().strip()
-                # Convert "9.4" to (9, 4)
-                parts = version_str.split('.')
-                major = int(parts[0])
-                minor = int(parts[1]) if len(parts) > 1 else 0
-                return (major, minor)
-        except:
-            pass
+    # Open directly rather than probing first; a missing file is just another failure
+    try:
+        version_str = version_file.read_text().strip()
+        # Convert "9.4" to (9, 4)
+        parts = version_str.split('.')
+        major = int(parts[0])
+        minor = int(parts[1]) if len(parts) > 1 else 0
+        return (major, minor)
+    except (OSError, ValueError):
+        pass
     
     # Default to PostgreSQL 9.4 (Alfresco 5.2 default)
     print_warning("Could not detect PostgreSQL version, assuming 9.4 (Alfresco 5.2)")
@@ -978,11 +1251,12 @@ def get_wal_level_value(pg_version: tuple) -> str:
     else:
         return 'hot_standby'
 
-def configure_postgresql():
+def configure_postgresql(config: Optional[dict] = None):
     """Automatically configure PostgreSQL for WAL archiving."""
     print_header("Step 5: Configure PostgreSQL for WAL Archiving")
     
-    config = load_env_config()
+    if config is None:
+        config = load_env_config()
     s3_enabled = bool(config.get('S3_BUCKET'))
     alf_base_dir = config.get('ALF_BASE_DIR')
     pg_user = config.get('PGUSER', 'alfresco')
@@ -1057,7 +1331,9 @@ def configure_postgresql():
     
     # Backup postgresql.conf
     print_info("\nBacking up configuration files...")
-    if not backup_file(pg_conf):
+    # postgresql.conf is only ever replaced via _atomic_rewrite, so a hard link
+    # keeps the original contents; pg_hba.conf is appended to in place
+    if not backup_file(pg_conf, hardlink=True):
         return False
     if not backup_file(pg_hba):
         return False
@@ -1078,10 +1354,8 @@ def configure_postgresql():
     else:
         settings.append(('wal_keep_size', '1GB'))
     
-    for setting, value in settings:
-        if not update_postgresql_conf_setting(pg_conf, setting, value, wal_dir):
-            print_error(f"Failed to update {setting}")
-            return False
+    if not update_postgresql_conf_settings(pg_conf, settings, wal_dir):
+        return False
     
     print_success("postgresql.conf updated successfully")
     
@@ -1116,7 +1390,17 @@ def create_virtual_environment():
             print_info("Skipping virtual environment creation")
             return True
         print_info("Removing existing virtual environment...")
-        shutil.rmtree(venv_path)
+        # Move it aside (a single rename) and delete it in the background, so the
+        # new venv is built while the old tree's many small files are unlinked
+        old_path = venv_path.with_name(f'venv.old.{os.getpid()}')
+        try:
+            os.rename(venv_path, old_path)
+        except OSError:
+            shutil.rmtree(venv_path)
+        else:
+            subprocess.Popen(['rm', '-rf', '--', str(old_path)], stdin=subprocess.DEVNULL,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                             start_new_session=True)
     
     if not ask_yes_no("\nCreate virtual environment and install dependencies?"):
         print_warning("Skipping virtual environment creation")
@@ -1125,7 +1409,8 @@ def create_virtual_environment():
     try:
         # Check if venv module is available
         print_info("\nChecking if venv module is available...")
-        check_result = run_command([sys.executable, '-m', 'venv', '--help'], capture_output=True, check=False)
+        check_result = run_command([sys.executable, '-m', 'venv', '--help'], check=False,
+                                   discard_output=True)
         if check_result is None or check_result.returncode != 0:
             print_error("Python venv module is not available")
             print_info("\nOn Debian/Ubuntu systems, install python3-venv package:")
@@ -1181,14 +1466,26 @@ def create_virtual_environment():
         # Determine pip path
         pip_path = venv_path / 'bin' / 'pip'
         
-        # Install dependencies
+        # Install dependencies; uv resolves and installs much faster when present,
+        # otherwise pip prefers ready-made wheels over building from source
         print_info("\nInstalling dependencies from requirements.txt...")
+        uv_path = shutil.which('uv')
+        if uv_path and running_as_root and not user_can_execute(uv_path, real_user):
+            # which() searched root's PATH (e.g. /root/.local/bin), which the real user usually cannot reach
+            print_info(f"uv at {uv_path} is not executable by {real_user}; using pip instead")
+            uv_path = None
+        if uv_path:
+            install_cmd = [uv_path, 'pip', 'install', '--python', str(venv_path / 'bin' / 'python'),
+                           '-r', 'requirements.txt']
+        else:
+            install_cmd = [str(pip_path), 'install', '--prefer-binary', '-r', 'requirements.txt']
         
         if running_as_root:
-            # Run pip as the real user
-            result = run_command(['sudo', '-u', real_user, str(pip_path), 'install', '-r', 'requirements.txt'], check=True)
+            # Run the installer as the real user; -H points HOME (and so the
+            # persistent download cache in ~/.cache) at that user's home
+            result = run_command(['sudo', '-H', '-u', real_user] + install_cmd, check=True)
         else:
-            result = run_command([str(pip_path), 'install', '-r', 'requirements.txt'], check=True)
+            result = run_command(install_cmd, check=True)
         
         if result is None:
             print_error("Failed to install dependencies")
@@ -1206,15 +1503,47 @@ def create_virtual_environment():
         print_error(f"Error setting up virtual environment: {e}")
         return False
 
+def user_can_execute(path: str, user: str) -> bool:
+    """
+    Return True if user may run the program at path.
+    Asks test -x as that user, because the answer also depends on search
+    permission on every parent directory, not just the file's own mode bits.
+    """
+    try:
+        result = subprocess.run(['sudo', '-u', user, 'test', '-x', path], stdin=subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+    except OSError:
+        return False
+    return result.returncode == 0
+
+def user_can_write_dir(path: Path, user: str, uid: int, gid: int) -> bool:
+    """
+    Return True if user may create files in directory path.
+    os.access answers for this process's real UID, which is root under sudo,
+    so in that case the owner, group and other permission bits are checked
+    against the real user's UID and groups instead (ACLs are not consulted).
+    """
+    if not is_running_as_root():
+        return os.access(path, os.W_OK | os.X_OK)
+    if uid == 0:
+        # Root bypasses the permission bits, so they would only give false negatives
+        return True
+    
+    st = os.stat(path)
+    if st.st_uid == uid:
+        needed = stat.S_IWUSR | stat.S_IXUSR
+    elif st.st_gid in os.getgrouplist(user, gid):
+        needed = stat.S_IWGRP | stat.S_IXGRP
+    else:
+        needed = stat.S_IWOTH | stat.S_IXOTH
+    return st.st_mode & needed == needed
+
 def configure_cron_job():
     """Configure cron job for automated backups."""
     print_header("Step 5: Configure Cron Job")
     
     real_user, real_uid, real_gid = get_real_user()
     current_dir = Path.cwd().absolute()
-    venv_python = current_dir / 'venv' / 'bin' / 'python'
-    backup_script = current_dir / 'backup.py'
-    log_dir = Path('/var/log/alfresco-backup')
     
     print_info("Setting up automated daily backups via cron.")
     print_info(f"Cron job will be added for user: {real_user}")
@@ -1224,19 +1553,35 @@ def configure_cron_job():
     # Check if cron job already exists
     # Use -u flag when running as root to target the real user's crontab
     crontab_cmd = ['crontab', '-u', real_user, '-l'] if running_as_root else ['crontab', '-l']
-    result = run_command(crontab_cmd, capture_output=True, check=False)
+    # Always ask crontab itself: guessing from the spool layout can miss an
+    # existing crontab, and the replacement installed below would then drop it
+    result = run_command(crontab_cmd, capture_output=True, check=False, log_output=False,
+                         cacheable=True)
     existing_crontab = result.stdout if result and result.returncode == 0 else ""
     
-    if 'backup.py' in existing_crontab and str(current_dir) in existing_crontab:
+    # Split the crontab in one pass into this directory's backup.py entries,
+    # which are replaced below, and every other line, which is kept as is
+    dir_pattern = re.escape(str(current_dir))
+    entry_re = re.compile(rf'backup\.py.*{dir_pattern}|{dir_pattern}.*backup\.py')
+    existing_entries = []
+    other_lines = []
+    for line in existing_crontab.splitlines(True):
+        (existing_entries if entry_re.search(line) else other_lines).append(line)
+    
+    if existing_entries:
         print_success("Cron job already configured")
         print_info("\nExisting cron entry found:")
-        for line in existing_crontab.split('\n'):
-            if 'backup.py' in line:
-                print_info(f"  {line}")
+        for line in existing_entries:
+            print_info(f"  {line.rstrip()}")
         
         if not ask_yes_no("\nReconfigure cron job?", default=False):
             return True
     
+    # Only needed once a cron entry is actually going to be written
+    venv_python = current_dir / 'venv' / 'bin' / 'python'
+    backup_script = current_dir / 'backup.py'
+    log_dir = Path('/var/log/alfresco-backup')
+    
     # Ask for schedule
     print_info("\nDefault schedule: Daily at 2:00 AM")
     if ask_yes_no("Use default schedule?", default=True):
@@ -1248,7 +1593,7 @@ def configure_cron_job():
         print_info("  0 2 * * *    - 2:00 AM every day")
         print_info("  0 3 * * 0    - 3:00 AM every Sunday")
         print_info("  0 */6 * * *  - Every 6 hours")
-        cron_time = input(f"{Colors.OKCYAN}Cron schedule: {Colors.ENDC}").strip() or "0 2 * * *"
+        cron_time = prompt_line("Cron schedule") or "0 2 * * *"
         schedule_desc = cron_time
     
     # Create log directory if it doesn't exist
@@ -1265,10 +1610,12 @@ def configure_cron_job():
         except PermissionError:
             print_warning(f"Cannot create {log_dir} - need sudo")
             if ask_yes_no("Create log directory with sudo?"):
-                result = run_command(['sudo', 'mkdir', '-p', str(log_dir)], check=False)
-                if result is None or result.returncode == 0:
-                    run_command(['sudo', 'chown', f'{real_user}:{real_user}', str(log_dir)], check=False)
-                    run_command(['sudo', 'chmod', '755', str(log_dir)], check=False)
+                # Run mkdir, chown and chmod in one shell so sudo is only invoked once
+                quoted_dir = shlex.quote(str(log_dir))
+                owner = shlex.quote(f'{real_user}:{real_user}')
+                script = f'mkdir -p {quoted_dir} && chown {owner} {quoted_dir} && chmod 755 {quoted_dir}'
+                result = run_command(['sudo', 'sh', '-c', script], check=False)
+                if result and result.returncode == 0:
                     print_success(f"Created log directory: {log_dir}")
                 else:
                     print_error(f"Failed to create log directory")
@@ -1279,18 +1626,21 @@ def configure_cron_job():
                 return False
     else:
         print_success(f"Log directory already exists: {log_dir}")
-        # Verify permissions
-        try:
-            test_file = log_dir / '.test'
-            test_file.touch()
-            test_file.unlink()
+        # Verify permissions without creating a probe file
+        if user_can_write_dir(log_dir, real_user, real_uid, real_gid):
             print_success(f"Log directory is writable by {real_user}")
-        except PermissionError:
+        else:
             print_error(f"Log directory exists but is not writable by {real_user}")
             if ask_yes_no("Fix permissions with sudo?"):
-                run_command(['sudo', 'chown', f'{real_user}:{real_user}', str(log_dir)], check=False)
-                run_command(['sudo', 'chmod', '755', str(log_dir)], check=False)
-                print_success("Fixed log directory permissions")
+                quoted_dir = shlex.quote(str(log_dir))
+                owner = shlex.quote(f'{real_user}:{real_user}')
+                result = run_command(['sudo', 'sh', '-c', f'chown {owner} {quoted_dir} && chmod 755 {quoted_dir}'], check=False)
+                if result and result.returncode == 0:
+                    print_success("Fixed log directory permissions")
+                else:
+                    print_error("Failed to fix log directory permissions")
+                    print_warning("Cron job will fail without a writable log directory")
+                    return False
             else:
                 print_warning("Cron job may fail due to permission issues")
                 return False
@@ -1313,47 +1663,29 @@ def configure_cron_job():
     
     # Add cron job
     try:
-        # Build new crontab content
-        new_crontab = existing_crontab
-        
-        # Remove any existing backup.py entries for this directory to avoid duplicates
-        if existing_crontab:
-            lines = []
-            for line in existing_crontab.split('\n'):
-                if not ('backup.py' in line and str(current_dir) in line):
-                    lines.append(line)
-            new_crontab = '\n'.join(lines).strip()
+        # Build new crontab content without the existing backup.py entries for
+        # this directory to avoid duplicates
+        new_crontab = ''.join(other_lines).strip()
         
         # Add new entry
         if new_crontab:
             new_crontab += '\n'
-        new_crontab += f"\n# Alfresco backup - added by setup script\n"
-        new_crontab += f"{cron_entry}\n"
-        
-        # Write new crontab
-        import tempfile
-        with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
-            f.write(new_crontab)
-            temp_file = f.name
+        new_crontab += f"\n# Alfresco backup - added by setup script\n{cron_entry}\n"
         
-        try:
-            # Install new crontab (use -u flag when running as root)
-            install_cmd = ['crontab', '-u', real_user, temp_file] if running_as_root else ['crontab', temp_file]
-            result = run_command(install_cmd, check=False)
-            if result and result.returncode == 0:
-                print_success("Cron job added successfully")
-                
-                # Verify (use -u flag when running as root)
-                verify_cmd = ['crontab', '-u', real_user, '-l'] if running_as_root else ['crontab', '-l']
-                result = run_command(verify_cmd, capture_output=True, check=False)
-                if result and 'backup.py' in result.stdout:
-                    print_success(f"Verified: Cron job is active for user {real_user}")
-                return True
-            else:
-                print_error("Failed to add cron job")
-                return False
-        finally:
-            os.unlink(temp_file)
+        # Install new crontab from stdin ('-') so no temporary file is needed
+        # (use -u flag when running as root)
+        install_cmd = ['crontab', '-u', real_user, '-'] if running_as_root else ['crontab', '-']
+        result = run_command(install_cmd, check=False, input_text=new_crontab)
+        if result and result.returncode == 0:
+            # crontab only exits 0 once it has installed what we sent,
+            # so there is no need to read it back with crontab -l
+            print_success("Cron job added successfully")
+            print_success(f"Cron job is active for user {real_user}")
+            forget_command(crontab_cmd, capture_output=True)
+            return True
+        else:
+            print_error("Failed to add cron job")
+            return False
             
     except Exception as e:
         print_error(f"Error configuring cron job: {e}")
@@ -1362,6 +1694,37 @@ def configure_cron_job():
         print_info(f"  # Add: {cron_entry}")
         return False
 
+# Matches the distribution name at the start of a requirements.txt line
+_REQUIREMENT_NAME_RE = re.compile(r'\s*([A-Za-z0-9][A-Za-z0-9._-]*)')
+
+def _normalize_dist_name(name: str) -> str:
+    """Normalize a distribution name so 'python-dotenv' and 'python_dotenv' compare equal."""
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+def missing_requirements(venv_path: Path, requirements_file: Path) -> Optional[list]:
+    """
+    Return the requirements_file packages that have no .dist-info directory in
+    venv_path's site-packages, found with one glob instead of running pip.
+    Returns None when requirements_file cannot be read or no .dist-info exists.
+    """
+    try:
+        lines = requirements_file.read_text().splitlines()
+    except OSError:
+        return None
+    
+    # .dist-info directories are named <name>-<version>.dist-info
+    installed = {_normalize_dist_name(path.name.split('-', 1)[0])
+                 for path in venv_path.glob('lib/python*/site-packages/*.dist-info')}
+    if not installed:
+        return None
+    
+    missing = []
+    for line in lines:
+        match = _REQUIREMENT_NAME_RE.match(line)
+        if match and _normalize_dist_name(match.group(1)) not in installed:
+            missing.append(match.group(1))
+    return missing
+
 def verify_installation():
     """Verify the installation."""
     print_header("Step 6: Verify Installation")
@@ -1406,13 +1769,17 @@ def verify_installation():
         checks.append(True)
     else:
         backup_dir = config.get('BACKUP_DIR')
-        if backup_dir and Path(backup_dir).exists():
+        if backup_dir and os.path.isdir(backup_dir):
             print_success(f"Backup directory exists: {backup_dir}")
             
-            # Check subdirectories
+            # Check subdirectories with one directory read instead of a stat each
+            try:
+                with os.scandir(backup_dir) as entries:
+                    present = {entry.name for entry in entries}
+            except OSError:
+                present = set()
             for subdir in ['postgres', 'contentstore']:
-                path = Path(backup_dir) / subdir
-                if path.exists():
+                if subdir in present:
                     print_success(f"  {subdir}/ exists")
                 else:
                     print_error(f"  {subdir}/ missing")
@@ -1428,13 +1795,19 @@ def verify_installation():
     if venv_python.exists():
         print_success("Virtual environment exists")
         
-        # Check if dependencies are installed
-        pip_path = Path('venv/bin/pip')
-        result = run_command([str(pip_path), 'list'], capture_output=True, check=False)
-        if result and 'python-dotenv' in result.stdout:
-            print_success("  Dependencies installed")
+        # Check every requirement against the venv's .dist-info directories
+        # rather than starting pip
+        missing = missing_requirements(Path('venv'), Path('requirements.txt'))
+        if missing is None:
+            # Unreadable requirements.txt or unusual layout: look for dotenv itself
+            if any(Path('venv/lib').glob('python*/site-packages/dotenv')):
+                print_success("  Dependencies installed")
+            else:
+                print_warning("  Dependencies may not be installed")
+        elif missing:
+            print_warning(f"  Dependencies not installed: {', '.join(missing)}")
         else:
-            print_warning("  Dependencies may not be installed")
+            print_success("  Dependencies installed")
         checks.append(True)
     else:
         print_error("Virtual environment missing")
@@ -1445,7 +1818,7 @@ def verify_installation():
     print_info("\n[4/6] Checking Alfresco contentstore path...")
     if alf_base_dir:
         contentstore_path = Path(alf_base_dir) / 'alf_data' / 'contentstore'
-        if contentstore_path.exists():
+        if cached_exists(contentstore_path):
             print_success(f"Contentstore found: {contentstore_path}")
             checks.append(True)
         else:
@@ -1477,7 +1850,8 @@ def verify_installation():
     
     # Use -u flag when running as root to check the real user's crontab
     crontab_cmd = ['crontab', '-u', real_user, '-l'] if running_as_root else ['crontab', '-l']
-    result = run_command(crontab_cmd, capture_output=True, check=False)
+    result = run_command(crontab_cmd, capture_output=True, check=False, log_output=False,
+                         cacheable=True)
     
     if result and result.returncode == 0:
         if 'backup.py' in result.stdout:
@@ -1514,16 +1888,33 @@ def verify_installation():
         print_error("\n✗ Some critical checks failed. Please review the errors above.")
         return False
 
-def create_restore_env_file():
-    """Create .env file for restore operations with all required configuration."""
+# Settings restore.py cannot run without; an existing .env with all of them set is reused
+_RESTORE_REQUIRED_KEYS = (
+    'PGHOST', 'PGPORT', 'PGUSER', 'PGPASSWORD', 'PGDATABASE', 'ALF_BASE_DIR', 'ALFRESCO_USER',
+)
+
+def create_restore_env_file() -> Optional[str]:
+    """
+    Create .env file for restore operations with all required configuration.
+    Returns the absolute path of the .env file in use, or None if it could not be set up.
+    """
     print_header("Restore Configuration")
     
     env_file = Path('.env')
+    env_path = str(env_file.absolute())
     
     if env_file.exists():
-        print_info(f".env file already exists at: {env_file.absolute()}")
-        if not ask_yes_no("Do you want to update it with restore configuration?", default=False):
-            return True
+        print_info(f".env file already exists at: {env_path}")
+        # Reuse the cached parse to see whether the re-run can skip the prompts
+        existing = load_env_config()
+        missing = [key for key in _RESTORE_REQUIRED_KEYS if not existing.get(key)]
+        if missing:
+            print_warning(f"Missing restore settings: {', '.join(missing)}")
+        else:
+            print_success("All required restore settings are present")
+        if not ask_yes_no("Do you want to update it with restore configuration?",
+                          default=bool(missing) or bool(_PRESET_ANSWERS)):
+            return env_path
     
     print_info("\nThe restore script needs the following information:")
     print_info("  - PostgreSQL connection details (host, port, user, password, database)")
@@ -1533,7 +1924,7 @@ def create_restore_env_file():
     
     if not ask_yes_no("\nConfigure restore settings now?"):
         print_warning("Skipping .env creation. Restore will fail without configuration.")
-        return False
+        return None
     
     # Collect backup location configuration
     print_info("\n--- Backup Location ---")
@@ -1541,7 +1932,8 @@ def create_restore_env_file():
     print_info("  1. Local directory (traditional backup on disk)")
     print_info("  2. S3 bucket (cloud backup, requires rclone)")
     
-    backup_location = input(f"{Colors.OKCYAN}Backup location (1 or 2) [1]: {Colors.ENDC}").strip() or '1'
+    default_location = '2' if _PRESET_ANSWERS.get('S3_BUCKET') else '1'
+    backup_location = prompt_line("Backup location (1 or 2)", default_location) or default_location
     
     backup_dir = None
     s3_bucket = None
@@ -1562,7 +1954,7 @@ def create_restore_env_file():
                     print_info("  sudo apt-get install -y rclone")
                     print_info("\nOr install from: https://rclone.org/install/")
                     if not ask_yes_no("Continue without rclone? (S3 restore will fail)", default=False):
-                        return False
+                        return None
             else:
                 print_warning("rclone is required for S3 restore")
                 print_info("Install it manually with:")
@@ -1570,39 +1962,47 @@ def create_restore_env_file():
                 print("  sudo apt-get install -y rclone")
                 print("\nOr install from: https://rclone.org/install/")
                 if not ask_yes_no("Continue without rclone? (S3 restore will fail)", default=False):
-                    return False
+                    return None
         
         while True:
-            s3_bucket = input(f"{Colors.OKCYAN}S3 bucket name: {Colors.ENDC}").strip()
+            s3_bucket = prompt_line("S3 bucket name", key='S3_BUCKET', required=True)
             if s3_bucket:
                 break
             print_error("S3 bucket name is required for S3 restore")
         
-        s3_region = input(f"{Colors.OKCYAN}S3 region [us-east-1]: {Colors.ENDC}").strip() or 'us-east-1'
+        s3_region = prompt_line("S3 region", 'us-east-1', key='S3_REGION') or 'us-east-1'
         while True:
-            aws_access_key_id = input(f"{Colors.OKCYAN}AWS Access Key ID: {Colors.ENDC}").strip()
+            aws_access_key_id = prompt_line("AWS Access Key ID", key='AWS_ACCESS_KEY_ID', required=True)
             if aws_access_key_id:
                 break
             print_error("AWS Access Key ID is required")
         while True:
-            aws_secret_access_key = input(f"{Colors.OKCYAN}AWS Secret Access Key: {Colors.ENDC}").strip()
+            aws_secret_access_key = prompt_line("AWS Secret Access Key", key='AWS_SECRET_ACCESS_KEY', required=True)
             if aws_secret_access_key:
                 break
             print_error("AWS Secret Access Key is required")
     else:
         print_info("\n--- Local Backup Directory ---")
         while True:
-            backup_dir = input(f"{Colors.OKCYAN}Backup directory path: {Colors.ENDC}").strip()
-            if backup_dir and Path(backup_dir).exists():
+            backup_dir = prompt_line("Backup directory path", key='BACKUP_DIR', required=True)
+            if backup_dir and os.path.isdir(backup_dir):
                 break
             print_error(f"Directory does not exist: {backup_dir}")
+            if _NON_INTERACTIVE:
+                return None
+            # Ask again instead of re-reading the same invalid --config answer
+            _PRESET_ANSWERS.pop('BACKUP_DIR', None)
             print_info("Please enter a valid backup directory path.")
     
     while True:
-        alf_base_dir = input(f"{Colors.OKCYAN}Alfresco base directory path: {Colors.ENDC}").strip()
-        if alf_base_dir and Path(alf_base_dir).exists():
+        alf_base_dir = prompt_line("Alfresco base directory path", key='ALF_BASE_DIR', required=True)
+        if alf_base_dir and os.path.isdir(alf_base_dir):
             break
         print_error(f"Directory does not exist: {alf_base_dir}")
+        if _NON_INTERACTIVE:
+            return None
+        # Ask again instead of re-reading the same invalid --config answer
+        _PRESET_ANSWERS.pop('ALF_BASE_DIR', None)
         print_info("Please enter a valid Alfresco base directory path.")
     
     # Try to auto-detect database settings from alfresco-global.properties
@@ -1617,7 +2017,9 @@ def create_restore_env_file():
         print_info(f"  User: {db_settings.get('user', 'not found')}")
         print_info(f"  Database: {db_settings.get('database', 'not found')}")
         
-        use_detected = ask_yes_no("Use these detected settings?", default=True)
+        # PostgreSQL answers given with --config take precedence over detection
+        preset_db = any(_PRESET_ANSWERS.get(env_key) for key, env_key, label, default in _PG_PROMPTS)
+        use_detected = ask_yes_no("Use these detected settings?", default=not preset_db)
         
         if use_detected:
             pg_host = db_settings.get('host', 'localhost')
@@ -1627,78 +2029,67 @@ def create_restore_env_file():
             pg_database = db_settings.get('database', 'postgres')
         else:
             # Manual entry with detected values as defaults
-            pg_host = input(f"{Colors.OKCYAN}PostgreSQL host [{db_settings.get('host', 'localhost')}]: {Colors.ENDC}").strip() or db_settings.get('host', 'localhost')
-            pg_port = input(f"{Colors.OKCYAN}PostgreSQL port [{db_settings.get('port', '5432')}]: {Colors.ENDC}").strip() or db_settings.get('port', '5432')
-            pg_user = input(f"{Colors.OKCYAN}PostgreSQL user [{db_settings.get('user', 'alfresco')}]: {Colors.ENDC}").strip() or db_settings.get('user', 'alfresco')
-            pg_password = input(f"{Colors.OKCYAN}PostgreSQL password: {Colors.ENDC}").strip()
-            if not pg_password:
-                pg_password = db_settings.get('password', '')
-            pg_database = input(f"{Colors.OKCYAN}PostgreSQL database [{db_settings.get('database', 'postgres')}]: {Colors.ENDC}").strip() or db_settings.get('database', 'postgres')
+            pg_host, pg_port, pg_user, pg_password, pg_database = prompt_db_settings(db_settings)
     else:
         print_warning("Could not auto-detect database settings. Please enter manually.")
-        pg_host = input(f"{Colors.OKCYAN}PostgreSQL host [localhost]: {Colors.ENDC}").strip() or 'localhost'
-        pg_port = input(f"{Colors.OKCYAN}PostgreSQL port [5432]: {Colors.ENDC}").strip() or '5432'
-        pg_user = input(f"{Colors.OKCYAN}PostgreSQL user [alfresco]: {Colors.ENDC}").strip() or 'alfresco'
-        pg_password = input(f"{Colors.OKCYAN}PostgreSQL password: {Colors.ENDC}").strip()
-        pg_database = input(f"{Colors.OKCYAN}PostgreSQL database [postgres]: {Colors.ENDC}").strip() or 'postgres'
+        pg_host, pg_port, pg_user, pg_password, pg_database = prompt_db_settings({})
     
     if not pg_password:
         print_error("PostgreSQL password is required for restore operations")
-        return False
+        return None
     
     # Collect customer name (optional)
     print_info("\n--- Customer Name (optional) ---")
     print_info("Customer name will be displayed prominently in email alerts")
-    customer_name = input(f"{Colors.OKCYAN}Customer name (for email alerts): {Colors.ENDC}").strip()
+    customer_name = prompt_line("Customer name (for email alerts)", key='CUSTOMER_NAME')
     
     # Collect Alfresco user
     real_user, real_uid, real_gid = get_real_user()
     print_info("\n--- Alfresco OS User ---")
-    alfresco_user = input(f"{Colors.OKCYAN}Alfresco OS user [{real_user}]: {Colors.ENDC}").strip() or real_user
+    alfresco_user = prompt_line("Alfresco OS user", real_user, key='ALFRESCO_USER') or real_user
     
     # Write .env file for restore
-    env_content = f"""# Restore Configuration
-# PostgreSQL Configuration
-PGHOST={pg_host}
-PGPORT={pg_port}
-PGUSER={pg_user}
-PGPASSWORD={pg_password}
-PGDATABASE={pg_database}
-
-# Path Configuration
-# BACKUP_DIR is only required for local backups (not needed for S3 backups)
-# Leave empty if using S3 restore
-BACKUP_DIR={backup_dir if backup_dir else ''}
-ALF_BASE_DIR={alf_base_dir}
-
-# S3 Backup Configuration (optional)
-# If S3_BUCKET is set, restore will download backups from S3
-# Requires rclone to be installed: https://rclone.org/install/
-S3_BUCKET={s3_bucket if s3_bucket else ''}
-S3_REGION={s3_region if s3_region else ''}
-AWS_ACCESS_KEY_ID={aws_access_key_id if aws_access_key_id else ''}
-AWS_SECRET_ACCESS_KEY={aws_secret_access_key if aws_secret_access_key else ''}
-
-# Customer Name (optional, displayed prominently in email alerts)
-CUSTOMER_NAME={customer_name}
-
-# Alfresco OS User
-ALFRESCO_USER={alfresco_user}
-"""
-    
-    with open(env_file, 'w') as f:
-        f.write(env_content)
-    
-    # Set ownership if running as root
-    if is_running_as_root():
-        os.chown(env_file, real_uid, real_gid)
+    # One entry per line: comments and blank separators as-is, settings as (key, value)
+    env_lines = [
+        "# Restore Configuration",
+        "# PostgreSQL Configuration",
+        ('PGHOST', pg_host),
+        ('PGPORT', pg_port),
+        ('PGUSER', pg_user),
+        ('PGPASSWORD', pg_password),
+        ('PGDATABASE', pg_database),
+        "",
+        "# Path Configuration",
+        "# BACKUP_DIR is only required for local backups (not needed for S3 backups)",
+        "# Leave empty if using S3 restore",
+        ('BACKUP_DIR', backup_dir or ''),
+        ('ALF_BASE_DIR', alf_base_dir),
+        "",
+        "# S3 Backup Configuration (optional)",
+        "# If S3_BUCKET is set, restore will download backups from S3",
+        "# Requires rclone to be installed: https://rclone.org/install/",
+        ('S3_BUCKET', s3_bucket or ''),
+        ('S3_REGION', s3_region or ''),
+        ('AWS_ACCESS_KEY_ID', aws_access_key_id or ''),
+        ('AWS_SECRET_ACCESS_KEY', aws_secret_access_key or ''),
+        "",
+        "# Customer Name (optional, displayed prominently in email alerts)",
+        ('CUSTOMER_NAME', customer_name),
+        "",
+        "# Alfresco OS User",
+        ('ALFRESCO_USER', alfresco_user),
+    ]
+    env_content = "".join(
+        f"{line[0]}={line[1]}\n" if isinstance(line, tuple) else f"{line}\n"
+        for line in env_lines
+    )
     
-    os.chmod(env_file, 0o600)  # Secure the file
+    write_private_file(env_file, env_content)
     
-    print_success(f"\n.env file created at: {env_file.absolute()}")
+    print_success(f"\n.env file created at: {env_path}")
     print_success("File permissions set to 600 (read/write for owner only)")
     
-    return True
+    return env_path
 
 def setup_restore_only():
     """Simplified setup flow for restore operations only."""
@@ -1736,13 +2127,14 @@ def setup_restore_only():
         sys.exit(1)
     
     # Create minimal .env file with PostgreSQL credentials
-    if not create_restore_env_file():
+    env_path = create_restore_env_file()
+    if not env_path:
         print_warning("Continuing without .env file. Restore operations may fail without PostgreSQL credentials.")
     
     print_header("Restore Setup Complete!")
     print_info("\n✓ Virtual environment created and dependencies installed")
-    if Path('.env').exists():
-        print_info("✓ Restore configuration saved to .env file:")
+    if env_path:
+        print_info(f"✓ Restore configuration saved to {env_path}:")
         print_info("  - PostgreSQL credentials")
         print_info("  - Backup directory path")
         print_info("  - Alfresco base directory path")
@@ -1753,10 +2145,59 @@ def setup_restore_only():
     print_info("If .env is missing or incomplete, it will prompt for missing values.")
     print_info("\nSee docs/operations/restore-runbook.md for detailed restore procedures.")
 
+def parse_args(argv=None):
+    """Parse command-line options."""
+    parser = ArgumentParser(description='Setup wizard for the Alfresco backup system.')
+    parser.add_argument('mode', nargs='?', choices=['restore'],
+                        help='Same as --restore')
+    parser.add_argument('-r', '--restore', action='store_true',
+                        help='Simplified setup for restore operations only')
+    parser.add_argument('--config', metavar='PATH',
+                        help='KEY=VALUE file (same format as .env) answering the .env prompts')
+    parser.add_argument('--non-interactive', action='store_true',
+                        help='Never prompt: use --config answers, then defaults')
+    parser.add_argument('--restart', action='store_true',
+                        help='Run every step again instead of resuming after the last completed one')
+    return parser.parse_args(argv)
+
+def load_preset_answers(path: str) -> bool:
+    """Load --config answers into _PRESET_ANSWERS."""
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        print_error(f"Cannot read config file {path}: {e}")
+        return False
+    
+    _PRESET_ANSWERS.update(_parse_env(os.path.abspath(path), st.st_mtime_ns, st.st_size))
+    return True
+
+def load_setup_state() -> set:
+    """Return the names of setup steps completed by an earlier, unfinished run."""
+    try:
+        return set(json.loads(_SETUP_STATE_FILE.read_text()).get('completed', []))
+    except (OSError, ValueError, AttributeError):
+        # Missing or unreadable state just means starting from the beginning
+        return set()
+
+def mark_step_done(completed: set, step: str):
+    """Record step as completed so a re-run of the wizard can skip it."""
+    completed.add(step)
+    try:
+        write_private_file(_SETUP_STATE_FILE, json.dumps({'completed': sorted(completed)}) + '\n')
+    except OSError as e:
+        print_warning(f"Could not save setup progress: {e}")
+
 def main():
     """Main setup flow."""
+    global _NON_INTERACTIVE
+    
+    args = parse_args()
+    _NON_INTERACTIVE = args.non_interactive
+    if args.config and not load_preset_answers(args.config):
+        sys.exit(1)
+    
     # Check if restore-only mode requested
-    if len(sys.argv) > 1 and sys.argv[1] in ['--restore', '-r', 'restore']:
+    if args.restore or args.mode == 'restore':
         setup_restore_only()
         return
     
@@ -1780,28 +2221,52 @@ def main():
         print_info("Setup canceled.")
         sys.exit(0)
     
-    # Step 1: Check prerequisites
+    # Steps that succeeded in an interrupted earlier run are skipped
+    completed = set() if args.restart else load_setup_state()
+    if completed:
+        print_info(f"Resuming setup; already completed: {', '.join(sorted(completed))}")
+        print_info("Use --restart to run every step again.")
+    
+    # Step 1: Check prerequisites (always, tools may have been removed since)
     if not check_prerequisites():
         print_info("Setup canceled.")
         sys.exit(0)
     
-    # Step 2: Create .env file
-    if not create_env_file():
-        print_warning("Setup cannot continue without .env file")
-        sys.exit(1)
+    # Step 2: Create .env file (again if it was removed since it was recorded)
+    config = load_env_config() if 'env' in completed else None
+    if not config:
+        completed.discard('env')
+        config = create_env_file()
+        if config is None:
+            print_warning("Setup cannot continue without .env file")
+            sys.exit(1)
+        mark_step_done(completed, 'env')
     
     # Step 3: Create directories
-    create_directories()
+    if 'directories' not in completed and create_directories(config):
+        mark_step_done(completed, 'directories')
     
     # Step 4: Create virtual environment
-    create_virtual_environment()
+    if 'venv' not in completed and create_virtual_environment():
+        mark_step_done(completed, 'venv')
     
     # Step 5: Configure cron job
-    configure_cron_job()
+    if 'cron' not in completed and configure_cron_job():
+        mark_step_done(completed, 'cron')
     
     # Step 6: Verify
     verify_installation()
     
+    # Keep the progress until every step has succeeded, so a re-run after a
+    # failed step (such as pip install) resumes there; a finished setup
+    # starts from the beginning next time
+    if _SETUP_STEPS <= completed:
+        with contextlib.suppress(FileNotFoundError):
+            _SETUP_STATE_FILE.unlink()
+    else:
+        remaining = ', '.join(sorted(_SETUP_STEPS - completed))
+        print_warning(f"\nNot completed: {remaining}. Run setup again to resume from these steps.")
+    
     print_header("Setup Complete!")
     print_info("See README.md for detailed documentation.")
 
@@ -1809,23 +2274,41 @@ def ensure_replication_privilege_for_alfresco(
     pg_data_dir: str, psql_bin: str, pg_ctl_bin: str
 ):
     """Ensure 'alfresco' user has REPLICATION privilege even in TCP-only mode."""
-    import shutil
     import subprocess
     import time
-
+    
     pg_hba = Path(pg_data_dir) / "pg_hba.conf"
-    if not pg_hba.exists():
+    try:
+        original_bytes = pg_hba.read_bytes()
+    except FileNotFoundError:
         print_error(f"pg_hba.conf not found at {pg_hba}")
         return False
-
-    backup_file = pg_hba.with_suffix(f".bak.auto.{int(time.time())}")
-    shutil.copy2(pg_hba, backup_file)
+    
+    # Write the backup from the bytes already read instead of copying the file again
+    # O_EXCL never clobbers an earlier backup; a counter separates runs within the same second
+    stamp = int(time.time())
+    attempt = 0
+    while True:
+        suffix = f".bak.auto.{stamp}" if attempt == 0 else f".bak.auto.{stamp}.{attempt}"
+        backup_file = pg_hba.with_suffix(suffix)
+        try:
+            fd = os.open(str(backup_file), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            break
+        except FileExistsError:
+            attempt += 1
+    try:
+        data = memoryview(original_bytes)
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
     print_success(f"Backed up pg_hba.conf → {backup_file}")
-
-    content = pg_hba.read_text().splitlines()
+    
+    # Keep the original text so it can be restored byte-for-byte afterwards
+    original = original_bytes.decode()
     patched = []
     inserted = False
-    for line in content:
+    for line in original.splitlines():
         if not inserted and "host" in line and "127.0.0.1/32" in line and "md5" in line:
             patched.append("host    all             postgres        127.0.0.1/32            trust")
             inserted = True
@@ -1833,57 +2316,55 @@ def ensure_replication_privilege_for_alfresco(
     if not inserted:
         patched.insert(0, "host    all             postgres        127.0.0.1/32            trust")
 
-    pg_hba.write_text("\n".join(patched) + "\n")
-    subprocess.run([pg_ctl_bin, "-D", pg_data_dir, "reload"], check=False)
+    # Replace the file atomically so a reload never reads it half-written
+    with _atomic_rewrite(pg_hba) as f:
+        f.write("\n".join(patched) + "\n")
+    # pg_ctl's "server signaled" line would interleave with our messages; errors still reach stderr
+    subprocess.run([pg_ctl_bin, "-D", pg_data_dir, "reload"], check=False, stdout=subprocess.DEVNULL)
     print_info("PostgreSQL configuration reloaded with temporary trust rule.")
 
-    grant_cmd = [
-        psql_bin,
-        "-h",
-        "127.0.0.1",
-        "-U",
-        "postgres",
-        "-d",
-        "postgres",
-        "-c",
-        "ALTER USER alfresco WITH REPLICATION;",
-    ]
-    result = subprocess.run(grant_cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        print_error(f"Grant failed: {result.stderr.strip()}")
-        return False
-    print_success("ALTER USER executed successfully.")
-
-    verify_cmd = [
-        psql_bin,
-        "-h",
-        "127.0.0.1",
-        "-U",
-        "postgres",
-        "-d",
-        "postgres",
-        "-t",
-        "-A",
-        "-c",
-        "SELECT rolreplication FROM pg_roles WHERE rolname='alfresco';",
-    ]
-    verify = subprocess.run(verify_cmd, capture_output=True, text=True)
-    if verify.returncode == 0 and verify.stdout.strip() == "t":
-        print_success("Replication privilege verified (rolreplication = t).")
-    else:
-        print_error("Replication verification failed.")
-        print_info(verify.stdout.strip())
-        return False
-
-    cleaned = [
-        line
-        for line in patched
-        if "postgres        127.0.0.1/32            trust" not in line
-    ]
-    pg_hba.write_text("\n".join(cleaned) + "\n")
-    subprocess.run([pg_ctl_bin, "-D", pg_data_dir, "reload"], check=False)
-    print_success("Temporary trust rule removed, pg_hba.conf restored.")
-    return True
+    try:
+        # Grant and verify in one psql session; ON_ERROR_STOP skips the SELECT
+        # if the ALTER fails, and -q -t -A leave only the rolreplication value
+        grant_cmd = [
+            psql_bin,
+            "-h",
+            "127.0.0.1",
+            "-U",
+            "postgres",
+            "-d",
+            "postgres",
+            "-X",
+            "-q",
+            "-t",
+            "-A",
+            "-v",
+            "ON_ERROR_STOP=1",
+            "-c",
+            "ALTER USER alfresco WITH REPLICATION; "
+            "SELECT rolreplication FROM pg_roles WHERE rolname='alfresco';",
+        ]
+        result = subprocess.run(grant_cmd, capture_output=True, text=True, stdin=subprocess.DEVNULL)
+        if result.returncode != 0:
+            print_error(f"Grant failed: {result.stderr.strip()}")
+            return False
+        print_success("ALTER USER executed successfully.")
+        
+        output_lines = result.stdout.strip().splitlines()
+        if output_lines and output_lines[-1].strip() == "t":
+            print_success("Replication privilege verified (rolreplication = t).")
+        else:
+            print_error("Replication verification failed.")
+            print_info(result.stdout.strip())
+            return False
+        return True
+    finally:
+        # Restore the original file rather than filtering the patched lines, so
+        # the trust rule never outlives this function, even when the grant fails
+        with _atomic_rewrite(pg_hba) as f:
+            f.write(original)
+        subprocess.run([pg_ctl_bin, "-D", pg_data_dir, "reload"], check=False, stdout=subprocess.DEVNULL)
+        print_success("Temporary trust rule removed, pg_hba.conf restored.")
 
 if __name__ == '__main__':
     try: